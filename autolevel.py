@@ -1,22 +1,23 @@
-import pyautogui
-import time
 import threading
-import win32gui
-import pywintypes
 import numpy as np
-import win32api
-import cv2
-from datetime import datetime
 import os
 import random
-import mss
-import mss.tools
 from PyQt5.QtWidgets import QWidget, QApplication
 from PyQt5.QtCore import Qt, QTimer, QObject, pyqtSignal
 from PyQt5.QtGui import QPainter, QPen, QColor
-import json
-import win32con
+from clock import SystemClock
 from config_manager import ConfigManager
+from frame_capture import Frame, FrameSnapshot, MSSFrameSource
+from state_machine import StateMachine, build_battle_table
+
+from template_registry import TemplateRegistry, CompiledTemplate, DEFAULT_THRESHOLD, MATCH_MODES
+from template_matcher import MatcherEngine, match_template, DEFAULT_CHANGE_TOLERANCE, DEFAULT_MAX_REUSE_AGE
+from search_regions import SearchRegions
+from state_cache import StateCache, difference_hash, DEFAULT_CACHE_SIZE, DEFAULT_HASH_TOLERANCE
+from window_backend import WindowGeometry, default_window_backend
+from input_dispatcher import InputDispatcher
+from input_backend import default_input_backend
+from bot_logging import BotLogger, INFO, WARNING, ERROR
 
 class HighlightSignal(QObject):
     highlight = pyqtSignal(tuple)  # (x, y, w, h)
@@ -64,9 +65,39 @@ class HighlightWindow(QWidget):
         # Draw the filled circle
         painter.drawEllipse(5, 5, self.width()-10, self.height()-10)
 
+# Hard minimum waits and poll settings of the battle flow (seconds), per profile
+DEFAULT_TIMINGS = {
+    'after_attack_key': 0.3,   # Minimum pause after pressing the attack number
+    'after_confirm_key': 0.3,  # Minimum pause after confirming the attack with F
+    'confirm_timeout': 1.0,    # Maximum wait for the attack animation after F
+    'ui_timeout': 5.0          # Maximum wait for the next battle UI element
+}
+
+# Every n-th capture of the bot loop grabs the full window even if regions suffice
+FULL_CAPTURE_INTERVAL = 20
+
+# Frames per second of the background capture thread, 0 captures on the bot thread
+DEFAULT_CAPTURE_FPS = 30
+
 class AutoLeveler:
-    def __init__(self):
+    def __init__(self, clock=None, window_backend=None, input_backend=None, config=None):
+        """Creates the bot
+        
+        Args:
+            clock: Optional clock for all waits and timestamps (SystemClock by default),
+                   a VirtualClock lets simulations run faster than real time
+            window_backend: Optional WindowBackend for window access and focus
+                            (the running desktop's by default, see window_backend.py)
+            input_backend: Optional InputBackend for keys and clicks (the running
+                           desktop's by default, a RecordingInputBackend records them)
+            config: Optional ConfigManager (the one of config.json by default),
+                    a MemoryConfigManager keeps simulations away from the user's settings
+        """
+        self.clock = clock or SystemClock()
         self.running = False
+        
+        # All messages go through the logger, the GUI drains it on a timer
+        self.logger = BotLogger(self.clock)
         self.battle_callback = None
         self.thread = None
         self.window_handle = None
@@ -82,17 +113,57 @@ class AutoLeveler:
             'died': []
         }
         
-        # Initialize thread local storage
-        self._thread_local = threading.local()
+        # Templates compiled for matching, rebuilt by set_templates
+        self.registry = TemplateRegistry()
+        
+        # Parallel evaluation of many templates against one frame
+        self.matcher = MatcherEngine(self.registry, regions=SearchRegions())
+        
+        # Screens seen before are recognized by their hash without matching
+        self.state_cache = StateCache()
+        
+        # Client area of the game window, queried from the window system only on changes
+        self.window_backend = window_backend or default_window_backend()
+        self.geometry = WindowGeometry(self.window_backend, clock=self.clock,
+                                       log=lambda msg, level: self._log(msg, level, 'window'))
+        self.geometry_version = 0  # Geometry version the capture settings were made for
+        
+        # Keys and clicks go out in bursts with one focus switch each
+        self.input_backend = input_backend or default_input_backend()
+        self.input = InputDispatcher(self.window_backend, self.input_backend, lambda: self.window_handle,
+                                     clock=self.clock, on_sent=self._on_input_sent,
+                                     log=lambda msg, level: self._log(msg, level, 'input'))
+        self.async_input = True  # False where an input thread cannot work (virtual time)
+        
+        # All frames come from a FrameSource (live window capture by default)
+        self.frame_source = MSSFrameSource(self._window_monitor, ready_func=lambda: bool(self.window_handle))
+        
+        # One shared capture per tick for all detectors
+        self.snapshot = FrameSnapshot(self.capture_frame, clock=self.clock,
+                                      log=lambda msg, level: self._log(msg, level, 'capture'))
+        
+        # Region capture: only the areas the current state watches are grabbed
+        self.region_capture = True
+        self.persist_regions = True  # Store learned regions on stop, only for the live game window
+        self.frame_size = None  # (width, height) of the last full capture
+        
+        # Background capture while the bot runs, so grabbing overlaps matching
+        self.capture_fps = DEFAULT_CAPTURE_FPS
+        self.async_capture = True  # False where a capture thread cannot work (virtual time)
+        self.captures_since_full = 0
         
         # Initialize config manager first
-        self.config = ConfigManager()
+        self.config = config or ConfigManager()
         
         # Initialize with values from config
         self.thresholds = {}
+        self.match_strategies = {}
+        self.match_modes = {}
+        self.timings = DEFAULT_TIMINGS.copy()
         profile = self.config.get_profile()
         if profile:
             self.thresholds = profile.get('thresholds', {}).copy()
+            self.timings.update(profile.get('timings', {}))
             self.highlight_enabled = profile.get('show_highlight', True)
             self.highlight_duration = profile.get('highlight_duration', 750)
         else:
@@ -103,15 +174,19 @@ class AutoLeveler:
         self.movement_mode = self.config.get('movement_mode', 'both')
         
         # Rest of initialization
-        self.last_state_change = time.time()
+        self.last_state_change = self.clock.time()
         self.current_state = "unknown"
         self.in_battle = False
         self.current_attack = 1
         self.attack_count = 0  # Counts how many times the current attack was used
         self.movement_direction = 0
-        self.last_direction_change = time.time()
+        self.last_direction_change = self.clock.time()
         self.pressed_keys = set()
-        self.death_retry_count = 0
+        self.current_key = None  # Movement key currently held
+        self.walk_count = 0
+        
+        # Overworld/battle logic, rebuilt on start with the profile timings
+        self.state_machine = self._build_state_machine()
         
         # Highlight system
         self.highlight_signal = HighlightSignal()
@@ -121,10 +196,7 @@ class AutoLeveler:
         try:
             os.makedirs('debug', exist_ok=True)
         except Exception as e:
-            msg = f"Could not create debug directory: {e}"
-            print(msg)
-            if hasattr(self, 'gui'):
-                self.gui.add_log_entry(msg)
+            self._log(f"Could not create debug directory: {e}", WARNING)
                 
         # Load active profile settings
         self.load_thresholds()
@@ -137,6 +209,39 @@ class AutoLeveler:
         if profile:
             # Update thresholds from profile
             self.thresholds = profile.get('thresholds', {}).copy()
+            self.registry.update_thresholds(self.thresholds)
+            
+            # Battle timings, missing values fall back to the defaults
+            self.timings = DEFAULT_TIMINGS.copy()
+            self.timings.update(profile.get('timings', {}))
+            
+            # Matching strategy per template type ('single' or 'pyramid')
+            self.match_strategies = profile.get('match_strategies', {}).copy()
+            self.registry.update_strategies(self.match_strategies)
+            
+            # Pixel layout per template type ('bgr', 'gray', 'b', 'g' or 'r')
+            self.match_modes = profile.get('match_modes', {}).copy()
+            self.registry.update_modes(self.match_modes)
+            
+            # Search regions learned with this profile
+            self.load_search_regions(profile)
+            self.region_capture = profile.get('region_capture', True)
+            self.capture_fps = profile.get('capture_fps', DEFAULT_CAPTURE_FPS)
+            
+            # Reuse of match results while the searched areas do not change
+            change_detection = profile.get('change_detection', {})
+            self.matcher.change_tolerance = change_detection.get('tolerance', DEFAULT_CHANGE_TOLERANCE)
+            self.matcher.max_reuse_age = change_detection.get('max_reuse_age', DEFAULT_MAX_REUSE_AGE)
+            
+            # Log level and rate limits per category
+            log_settings = profile.get('logging', {})
+            self.logger.configure(level=log_settings.get('level'), rate_limits=log_settings.get('rate_limits'))
+            
+            # Cached screens were classified with the old settings
+            state_cache = profile.get('state_cache', {})
+            self.state_cache.configure(state_cache.get('size', DEFAULT_CACHE_SIZE),
+                                       state_cache.get('tolerance', DEFAULT_HASH_TOLERANCE))
+            self.state_cache.clear()
                     
             # Set highlight settings from profile
             self.highlight_enabled = profile.get('show_highlight', True)
@@ -154,18 +259,53 @@ class AutoLeveler:
         # Only save if values actually changed
         if (profile.get('show_highlight') != self.highlight_enabled or
             profile.get('highlight_duration') != self.highlight_duration or
-            profile.get('thresholds') != self.thresholds):
+            profile.get('thresholds') != self.thresholds or
+            profile.get('timings') != self.timings):
             
-            profile_data = {
+            # Keep other profile keys untouched
+            profile_data = dict(profile)
+            profile_data.update({
                 'show_highlight': self.highlight_enabled,
                 'highlight_duration': self.highlight_duration,
-                'thresholds': self.thresholds.copy()
-            }
+                'thresholds': self.thresholds.copy(),
+                'timings': self.timings.copy()
+            })
             self.config.set_profile(self.config.get_active_profile(), profile_data, save=True)
 
     def set_thresholds(self, thresholds):
         """Sets new threshold values"""
         self.thresholds.update(thresholds)
+        self.registry.update_thresholds(self.thresholds)
+        self.state_cache.clear()
+        self.save_thresholds()
+
+    def load_search_regions(self, profile=None):
+        """Uses the search regions stored in a profile (the active one by default)"""
+        if profile is None:
+            profile = self.config.get_profile() or {}
+        self.matcher.regions = SearchRegions.from_config(profile.get('search_regions'))
+
+    def save_search_regions(self):
+        """Stores newly learned search regions in the active profile
+        
+        Only regions learned on the live game window are stored; a simulator
+        or benchmark sets persist_regions to False, its positions mean
+        nothing for the real game.
+        """
+        regions = self.matcher.regions
+        if not self.persist_regions or not regions or not regions.dirty:
+            return
+        profile = self.config.get_profile()
+        if profile is None:
+            return
+        profile_data = dict(profile)
+        profile_data['search_regions'] = regions.to_config()
+        self.config.set_profile(self.config.get_active_profile(), profile_data, save=True)
+        regions.dirty = False
+
+    def set_timings(self, timings):
+        """Sets new battle timings (see DEFAULT_TIMINGS)"""
+        self.timings.update(timings)
         self.save_thresholds()
 
     def set_movement_mode(self, mode):
@@ -213,90 +353,129 @@ class AutoLeveler:
             if self.highlight_window:
                 self.highlight_signal.highlight.emit((x, y, w, h))
         except Exception as e:
-            print(f"Error showing highlight: {e}")
-
-    def _ensure_mss(self):
-        """Ensures MSS is initialized in the current thread"""
-        if not hasattr(self._thread_local, 'sct'):
-            self._thread_local.sct = mss.mss()
-        return self._thread_local.sct
+            self._log(f"Error showing highlight: {e}", WARNING, 'highlight')
 
     def get_screen_coordinates(self, window_handle):
-        """Gets the correct screen coordinates for a window, accounting for multiple monitors"""
-        try:
-            # Get the monitor info
-            monitor = win32api.MonitorFromWindow(window_handle)
-            monitor_info = win32api.GetMonitorInfo(monitor)
-            monitor_area = monitor_info['Monitor']
-            
-            # Get the window rect
-            window_rect = win32gui.GetWindowRect(window_handle)
-            client_rect = win32gui.GetClientRect(window_handle)
-            
-            # Convert client coordinates to screen coordinates
-            left, top = win32gui.ClientToScreen(window_handle, (0, 0))
-            right, bottom = win32gui.ClientToScreen(window_handle, (client_rect[2], client_rect[3]))
+        """Gets the screen coordinates of a window's client area as MSS monitor dict
+        
+        The geometry is cached (see window_backend.WindowGeometry), a moved or
+        resized window is noticed by a cheap window rect check.
+        """
+        return self.geometry.get(window_handle)
             
-            # Create monitor dict for MSS
-            monitor = {
-                "top": top,
-                "left": left,
-                "width": right - left,
-                "height": bottom - top
-            }
+    def _window_monitor(self):
+        """Returns the monitor dict of the attached window for live capture"""
+        if not self.window_handle:
+            return None
+        return self.get_screen_coordinates(self.window_handle)
             
-            return monitor
+    def set_frame_source(self, frame_source):
+        """Replaces the frame source, e.g. with a recorded session for replay
+        
+        Args:
+            frame_source: FrameSource instance, None restores live capture
+        """
+        if frame_source is None:
+            frame_source = MSSFrameSource(self._window_monitor, ready_func=lambda: bool(self.window_handle))
+        if self.frame_source is not frame_source:
+            self.frame_source.close()
+        self.frame_source = frame_source
+        self.snapshot.invalidate()
             
-        except Exception as e:
-            print(f"Error getting screen coordinates: {e}")
+    def capture_frame(self, out=None):
+        """Captures the Temtem client area and converts it to BGR once
+        
+        Args:
+            out: Optional preallocated BGR buffer the source may convert into
+        
+        Returns:
+            Tuple (bgr_image, monitor[, regions]) or None if no frame is available
+        """
+        if not self.frame_source.is_ready():
+            return None
+        
+        # The window moved or was resized: capture it completely before using regions again
+        if self.geometry.version != self.geometry_version:
+            self.geometry_version = self.geometry.version
+            self.frame_size = None
+        
+        regions = self._capture_regions()
+        if regions is not None:
+            return self.frame_source.grab_regions(regions, out)
+        
+        captured = self.frame_source.grab(out)
+        if captured:
+            image = captured[0]
+            self.frame_size = (image.shape[1], image.shape[0])
+            self.captures_since_full = 0
+        return captured
+        
+    def _capture_regions(self):
+        """Returns the rects the current state needs, or None for a full capture"""
+        # Only the bot loop knows which screens it waits for, GUI tests grab everything
+        if not self.region_capture or self.frame_size is None:
+            return None
+        if threading.current_thread() is not self.thread and not self.snapshot.is_capture_thread():
+            return None
+        
+        # Periodic full capture, so the regions can still be widened
+        self.captures_since_full += 1
+        if self.captures_since_full >= FULL_CAPTURE_INTERVAL:
             return None
         
+        regions = []
+        for template_type in self.state_machine.spec.watch or self.SCREEN_PRIORITY:
+            if not self.registry.of_type(template_type):
+                continue  # Nothing to look for
+            area = self.matcher.regions.area(template_type, self.frame_size)
+            if area is None:
+                return None  # Region not learned yet
+            regions.append(area)
+        
+        # Battle end pixel at 95% width, 5% height
+        width, height = self.frame_size
+        pixel_x = int(width * 0.95)
+        pixel_y = int(height * 0.05)
+        regions.append((pixel_x, pixel_y, pixel_x + 1, pixel_y + 1))
+        return regions
+        
     def attach_to_window(self):
         """Finds and attaches to the Temtem window"""
         try:
-            def window_enum_callback(hwnd, results):
-                if win32gui.IsWindowVisible(hwnd):
-                    window_title = win32gui.GetWindowText(hwnd)
-                    # Only search for the exact window title "Temtem"
-                    if window_title == "Temtem":
-                        print(f"Found Temtem game window")
-                        results.append(hwnd)
-                return True
-
-            print("Searching for Temtem window...")
-            results = []
-            win32gui.EnumWindows(window_enum_callback, results)
+            self._log("Searching for Temtem window...", INFO, 'window')
+            # Only search for the exact window title "Temtem"
+            handle = self.window_backend.find_window("Temtem")
             
-            if results:
-                self.window_handle = results[0]
+            if handle:
+                self._log("Found Temtem game window", INFO, 'window')
+                self.window_handle = handle
                 # Bring window to foreground
                 try:
-                    win32gui.ShowWindow(self.window_handle, 9)  # SW_RESTORE
-                    win32gui.SetForegroundWindow(self.window_handle)
+                    self.window_backend.restore(self.window_handle)
+                    self.window_backend.set_foreground(self.window_handle)
                 except Exception as e:
-                    print(f"Warning: Could not bring window to foreground: {e}")
+                    self._log(f"Warning: Could not bring window to foreground: {e}", WARNING, 'window')
                     
                 # Verify window is valid
                 try:
-                    rect = win32gui.GetWindowRect(self.window_handle)
+                    rect = self.window_backend.window_rect(self.window_handle)
                     if rect[0] < -10000 or rect[1] < -10000 or rect[2] > 10000 or rect[3] > 10000:
-                        print("Invalid window coordinates, trying next window...")
+                        self._log("Invalid window coordinates, trying next window...", WARNING, 'window')
                         return False
                 except:
-                    print("Could not get window coordinates")
+                    self._log("Could not get window coordinates", WARNING, 'window')
                     return False
                     
-                print(f"Successfully attached to Temtem game window")
+                # Restoring may have moved the window
+                self.geometry.invalidate()
+                self._log("Successfully attached to Temtem game window", INFO, 'window')
                 return True
                 
-            print("No Temtem game window found")
+            self._log("No Temtem game window found", INFO, 'window')
             return False
             
-        except pywintypes.error as e:
-            print(f"Error searching for the Temtem window: {str(e)}")
-            return False
         except Exception as e:
-            print(f"Unexpected error: {str(e)}")
+            self._log(f"Error searching for the Temtem window: {str(e)}", ERROR, 'window')
             return False
         
     def start(self, battle_callback=None):
@@ -307,10 +486,15 @@ class AutoLeveler:
         """
         self.running = True
         self.battle_callback = battle_callback
+        self.state_machine = self._build_state_machine()
         
-        # PyAutoGUI configuration
-        pyautogui.FAILSAFE = False
-        pyautogui.PAUSE = 0.05
+        # Capture on its own thread, the loop takes the latest frame
+        if self.async_capture and self.capture_fps > 0:
+            self.snapshot.start_worker(self.capture_fps)
+        
+        # Send inputs from their own thread, grouped into bursts
+        if self.async_input:
+            self.input.start()
         
         # Start thread
         self.thread = threading.Thread(target=self._run)
@@ -322,507 +506,366 @@ class AutoLeveler:
         self.running = False
         if self.thread:
             self.thread.join(timeout=1.0)  # Wait a maximum of 1 second for the thread to end
-            
-        # Release all keys
-        for key in ['a', 'd', 'w', 's']:  # Add all possible keys
-            try:
-                pyautogui.keyUp(key)
-            except:
-                pass
+        
+        # Send what is still queued, then release the keys still held
+        self.input.stop()
+        self.release_all_keys()
+        
+        # Drop the last frame so a restart never reuses it
+        self.snapshot.stop_worker()
+        self.snapshot.invalidate()
+        
+        # Keep what the matcher learned about the UI layout
+        self.save_search_regions()
         
         # Reset all status variables
         self.in_battle = False
         self.current_state = "unknown"
         self.current_attack = 1
         self.attack_count = 0  # Counts how many times the current attack was used
-        self.death_retry_count = 0
+        self.current_key = None
+        self.state_machine.reset()
         
-    def send_key_to_window(self, key, hold=False, release=False):
+    def send_key_to_window(self, key, hold=False, release=False, delay=0.0):
         """Sends a keystroke safely to the Temtem window
         
+        While the bot runs the key is queued and sent by the input dispatcher,
+        together with the keys queued right after it (one focus switch).
+        
         Args:
             key: The key to send
             hold: Hold the key down
             release: Release the key
+            delay: Seconds to wait before the key (kept inside a burst)
         """
         if not self.window_handle:
             return
+        self.input.key(key, hold=hold, release=release, delay=delay)
+        
+    def _on_input_sent(self):
+        # The screen reacts to the input, so the current frame is outdated
+        self.snapshot.invalidate()
             
+    def _build_state_machine(self):
+        """Creates the state machine with the current timings and the bot actions"""
+        actions = {
+            'walk': self.walk,
+            'release_keys': self.release_movement_key,
+            'select_attack': self.select_attack,
+            'confirm_attack': self.confirm_attack,
+            'confirm_kill': lambda: self._press_confirm("Kill button found - sending F", 'f'),
+            'confirm_chose': lambda: self._press_confirm("Chose button found - sending F", 'f'),
+            'dismiss_chose': lambda: self.send_mouse_click(right_click=True),
+            'confirm_overload': lambda: self._press_confirm("Overload button found - sending 6", '6'),
+            'revive': self.revive
+        }
+        return StateMachine(build_battle_table(self.timings), actions, self.clock,
+                            log=lambda msg: self._log(msg, category='state'))
 
-        try:
-            # Save the current active window
-            current_window = win32gui.GetForegroundWindow()
-            
-            # Activate Temtem window
-            win32gui.SetForegroundWindow(self.window_handle)
-            time.sleep(0.03)
-            
-            # Send key
-            if release:
-                pyautogui.keyUp(key)
-            elif hold:
-                pyautogui.keyDown(key)
-            else:
-                pyautogui.press(key)
-            
-            # Restore the original window
-            if current_window != self.window_handle:
-                win32gui.SetForegroundWindow(current_window)
-                
-        except Exception as e:
-            print(f"Error sending key: {e}")
-            
-    def handle_battle(self):
-        """Handles battle actions"""
-        # Check for death first
-        if self.check_for_death():
-            return
-
-        # Check if we should still run
-        if not self.running:
-            return
-
-        # Double check if we're really in battle (not on map)
-        for template in self.templates['map']:
-            if self.find_image_in_window(template['image']):
-                msg = "On map - not executing battle action"
-                print(msg)
-                self.gui.add_log_entry(msg)
-                return
-            
-        # Check if we can execute an action
-        if not self.can_battle_action():
-            msg = "Cannot execute battle action - waiting for battle UI..."
-            print(msg)
-            self.gui.add_log_entry(msg)
-            # Wait up to 5 seconds for battle UI
-            start_time = time.time()
-            while time.time() - start_time < 5:
-                # Check if we should still run
-                if not self.running:
-                    return
-
-                # Check for chose button while waiting
-                if self.check_for_chose():
-                    msg = "Found and handled chose button"
-                    print(msg)
-                    self.gui.add_log_entry(msg)
-                    return
-                    
-                # Check if we can now execute an action and are not on map
-                if self.can_battle_action():
-                    map_visible = False
-                    for template in self.templates['map']:
-                        if self.find_image_in_window(template['image']):
-                            map_visible = True
-                            break
-                    if not map_visible:
-                        msg = "Battle UI visible - executing action"
-                        print(msg)
-                        self.gui.add_log_entry(msg)
-                        break
-                time.sleep(0.1)
-            else:
-                msg = "Battle UI not found after timeout"
-                print(msg)
-                self.gui.add_log_entry(msg)
-                return
+    def _log(self, msg, level=INFO, category='bot'):
+        """Logs a message to the console and the GUI log (see bot_logging.py)"""
+        self.logger.log(msg, level, category)
 
-        # Check if we should still run
-        if not self.running:
-            return
+    def _press_confirm(self, msg, key):
+        self._log(msg, category='battle')
+        self.send_key_to_window(key)
 
-        # Execute current attack
-        msg = f"Battle action: pressing {self.current_attack} then f (Attack {self.attack_count + 1}/5)"
-        print(msg)
-        self.gui.add_log_entry(msg)
+    def select_attack(self):
+        """Presses the number of the current attack"""
+        self._log(f"Battle action: pressing {self.current_attack} then f (Attack {self.attack_count + 1}/5)")
         self.send_key_to_window(str(self.current_attack))
-        time.sleep(1.0)  # Longer pause after number
 
-        # Check if we should still run
-        if not self.running:
-            return
-        
-        # Then F to confirm
+    def confirm_attack(self):
+        """Confirms the selected attack with F and rotates attacks every 5 uses"""
         self.send_key_to_window('f')
-        time.sleep(1.0)  # Longer pause after F for animation
-        
-        # Check if we should still run
-        if not self.running:
-            return
-
-        # Wait and check for kill button
-        self.check_for_kill()
-        
-        # Check if we should still run
-        if not self.running:
-            return
-
-        # Increment attack counter
         self.attack_count += 1
         
         # Switch attack after 5 uses
         if self.attack_count >= 5:
             self.attack_count = 0  # Reset counter
             self.current_attack = 2 if self.current_attack == 1 else 1  # Switch attack
-            msg = f"Switching to attack {self.current_attack} for next 5 turns"
-            print(msg)
-            self.gui.add_log_entry(msg)
+            self._log(f"Switching to attack {self.current_attack} for next 5 turns")
 
-        # Wait up to 5 seconds for next possible action
-        msg = "Waiting for next possible action..."
-        print(msg)
-        self.gui.add_log_entry(msg)
-        action_start = time.time()
-        while time.time() - action_start < 5:  # Maximum 5 seconds wait
-            # Check if we should still run
-            if not self.running:
-                return
+    def revive(self):
+        """Runs the revive sequence on the died screen"""
+        self._log(f"Death recovery attempt {self.state_machine.retries + 1}/{self.state_machine.spec.max_retries + 1}")
+        # Press W then F, sent as one burst
+        self.send_key_to_window('w')
+        self.send_key_to_window('f', delay=0.2)
 
-            if self.can_battle_action():  # If Run or Bag is visible again
-                msg = "Can execute next action"
-                print(msg)
-                self.gui.add_log_entry(msg)
-                # Execute next action immediately
-                self.handle_battle()
-                return
-            time.sleep(0.1)
-        msg = "No next action possible yet"
-        print(msg)
-        self.gui.add_log_entry(msg)
+    def release_movement_key(self):
+        """Releases the held movement key"""
+        if self.current_key:
+            self.send_key_to_window(self.current_key, release=True)
+            self.current_key = None
+
+    def release_all_keys(self):
+        """Releases every key the bot holds, e.g. after an error"""
+        self.current_key = None
+        self.input.release_all()
+
+    def walk(self):
+        """Moves back and forth on the map to trigger encounters"""
+        horizontal_keys = ['a', 'd']  # Left/Right
+        vertical_keys = ['s', 'w']    # Down/Up
         
+        # Change direction every 5-10 seconds in "both" mode
+        current_time = self.clock.time()
+        if self.movement_mode == "both" and current_time - self.last_direction_change > random.uniform(5, 10):
+            self.movement_direction = random.randint(0, 1)  # Random horizontal or vertical
+            self.last_direction_change = current_time
+            self.release_movement_key()
+        
+        # Choose key set based on movement mode
+        if self.movement_mode == "ad" or (self.movement_mode == "both" and self.movement_direction == 0):
+            keys = horizontal_keys
+        else:  # "sw" or (both and direction == 1)
+            keys = vertical_keys
+        
+        # Press new key
+        new_key = keys[self.walk_count % 2]
+        if new_key != self.current_key:
+            # Release and hold in one focus cycle
+            if self.window_handle:
+                self.input.switch_key(self.current_key, new_key)
+            self.current_key = new_key
+            self.walk_count += 1
+
     def _run(self):
         """Main bot loop"""
-        # Initialize MSS in this thread
-        sct = self._ensure_mss()
-        
-        horizontal_keys = ['a', 'd']  # Left/Right
-        vertical_keys = ['s', 'w']    # Down/Up
-        cnt = 0
         last_color = None
-        last_state = None
-        current_key = None  # Stores currently pressed key
         
         while self.running:
             try:
-                # Check if we should still run
-                if not self.running:
-                    if current_key:  # Release current key
-                        self.send_key_to_window(current_key, release=True)
-                    break
+                # Inputs still on their way: the screen cannot show their effect yet
+                if self.input.busy:
+                    self.clock.sleep(0.005)
+                    continue
                 
-                # Check status
-                current_state = self.get_game_state()
-                current_time = datetime.now().strftime("%H:%M:%S")
+                # Capture once for all checks of this tick
+                self.snapshot.refresh()
                 
-                # Status update when something changes
-                if current_state != last_state:
-                    if current_state == "map":
-                        msg = "On map"
-                        print(msg)
-                        self.gui.add_log_entry(msg)
-                    elif current_state == "battle":
-                        msg = "In battle"
-                        print(msg)
-                        self.gui.add_log_entry(msg)
-                        # Release all keys immediately when battle starts
-                        if current_key:
-                            self.send_key_to_window(current_key, release=True)
-                            current_key = None
-                        # Only execute battle action if we're really in battle
-                        if self.can_battle_action():
-                            # Check we're not on map
-                            map_visible = False
-                            for template in self.templates['map']:
-                                if self.find_image_in_window(template['image']):
-                                    map_visible = True
-                                    break
-                            if not map_visible:
-                                self.handle_battle()
-                    elif current_state == "died":
-                        msg = "Died - attempting revival"
-                        print(msg)
-                        self.gui.add_log_entry(msg)
-                        # Release all keys
-                        if current_key:
-                            self.send_key_to_window(current_key, release=True)
-                            current_key = None
-                        # Execute revival sequence
-                        self.check_for_death()
-                    elif current_state == "battle_loading":
-                        msg = "Loading battle action..."
-                        print(msg)
-                        self.gui.add_log_entry(msg)
-                    elif current_state == "loading":
-                        msg = "Loading..."
-                        print(msg)
-                        self.gui.add_log_entry(msg)
-                    else:
-                        msg = "Status unknown"
-                        print(msg)
-                        self.gui.add_log_entry(msg)
-                        # Release keys on unknown status too
-                        if current_key:
-                            self.send_key_to_window(current_key, release=True)
-                            current_key = None
-                    last_state = current_state
-                    self.current_state = current_state
-                
-                # Continuous checks based on current state
-                if current_state == "battle":
-                    # Check we're not on map
-                    map_visible = False
-                    for template in self.templates['map']:
-                        if self.find_image_in_window(template['image']):
-                            map_visible = True
-                            break
-                    if not map_visible:
-                        # Check for kill button first
-                        if self.check_for_kill():
-                            pass
-                        # Then check if we can do a battle action
-                        elif self.can_battle_action():
-                            self.handle_battle()
-                elif current_state == "died":
-                    # Continuously try to revive
-                    self.check_for_death()
-                
-                # Movement only when on map
-                if current_state == "map":
-                    # Change direction every 5-10 seconds in "both" mode
-                    current_time = time.time()
-                    if self.movement_mode == "both" and current_time - self.last_direction_change > random.uniform(5, 10):
-                        self.movement_direction = random.randint(0, 1)  # Random horizontal or vertical
-                        self.last_direction_change = current_time
-                        if current_key:  # Release current key
-                            self.send_key_to_window(current_key, release=True)
-                            current_key = None
-                    
-                    # Choose key set based on movement mode
-                    if self.movement_mode == "ad" or (self.movement_mode == "both" and self.movement_direction == 0):
-                        keys = horizontal_keys
-                    else:  # "sw" or (both and direction == 1)
-                        keys = vertical_keys
-                    
-                    # Press new key
-                    new_key = keys[cnt % 2]
-                    if new_key != current_key:
-                        if current_key:  # Release old key
-                            self.send_key_to_window(current_key, release=True)
-                        self.send_key_to_window(new_key, hold=True)
-                        current_key = new_key
-                        cnt += 1
+                # One transition per tick, driven by the classified screen
+                screen = self.get_game_state(self.state_machine.spec.watch)
+                state = self.state_machine.step(screen)
+                self.current_state = state
+                if self.state_machine.in_battle:
+                    self.in_battle = True
+                elif state == "overworld":
+                    self.in_battle = False
                 
                 # Battle detection with relative coordinates
                 try:
-                    monitor = self.get_screen_coordinates(self.window_handle)
-                    if monitor:
-                        # Screenshot with MSS
-                        screenshot = sct.grab(monitor)
-                        
+                    # Reuse the tick's frame (recaptured only if an input invalidated it)
+                    frame = self.snapshot.get()
+                    if frame:
                         # Position for battle detection (95% width, 5% height)
-                        pixel_x = int(monitor["width"] * 0.95)
-                        pixel_y = int(monitor["height"] * 0.05)
+                        pixel_x = int(frame.width * 0.95)
+                        pixel_y = int(frame.height * 0.05)
                         
                         # Check color at position
-                        color = screenshot.pixel(pixel_x, pixel_y)[:3]  # RGB without Alpha
+                        color = frame.pixel(pixel_x, pixel_y)  # RGB without Alpha
                         
                         if last_color != color:
                             if color == (60, 232, 234):  # Battle ended
                                 self.in_battle = False
-                                msg = "Battle ended"
-                                print(msg)
-                                self.gui.add_log_entry(msg)
+                                self._log("Battle ended")
                                 if self.battle_callback:
                                     self.battle_callback()
-                            elif current_state == "unknown" and not self.in_battle:
+                            elif state == "loading" and not self.in_battle:
                                 self.in_battle = True
-                                msg = "Battle started"
-                                print(msg)
-                                self.gui.add_log_entry(msg)
+                                self._log("Battle started")
                                 # Release keys immediately when battle is detected
-                                if current_key:
-                                    self.send_key_to_window(current_key, release=True)
-                                    current_key = None
+                                self.release_movement_key()
                         last_color = color
                 except Exception as e:
-                    msg = f"Error checking battle state: {e}"
-                    print(msg)
-                    self.gui.add_log_entry(msg)
+                    self._log(f"Error checking battle state: {e}", WARNING)
                     # Release keys on errors too
-                    if current_key:
-                        self.send_key_to_window(current_key, release=True)
-                        current_key = None
+                    self.release_all_keys()
                 
                 # Minimal delay for system stability
-                time.sleep(0.01)
+                self.clock.sleep(0.01)
                 
             except Exception as e:
-                msg = f"Error: {str(e)}"
-                print(msg)
-                self.gui.add_log_entry(msg)
+                self._log(f"Error: {str(e)}", ERROR)
                 # Release keys on errors too
-                if current_key:
-                    self.send_key_to_window(current_key, release=True)
-                    current_key = None
-                time.sleep(0.5)
-                
-    def get_game_state(self):
-        """Gets the current game state"""
-        try:
-            # Check if we're on the map
-            for template in self.templates['map']:
-                if self.find_image_in_window(template['image']):
-                    msg = "On map"
-                    print(msg)
-                    self.gui.add_log_entry(msg)
-                    self.in_battle = False
-                    return "map"
-                    
-            # If map not found, check for all other states
-            # Check for death first (highest priority)
-            for template in self.templates['died']:
-                if self.find_image_in_window(template['image']):
-                    msg = f"Death detected ({template['name']})"
-                    print(msg)
-                    self.gui.add_log_entry(msg)
-                    return "died"
-                    
-            # Check for battle UI
-            if self.can_battle_action():
-                msg = "In battle"
-                print(msg)
-                self.gui.add_log_entry(msg)
-                self.in_battle = True
-                return "battle"
+                self.release_all_keys()
+                self.clock.sleep(0.5)
+        
+        # Release the movement key when stopped
+        self.release_movement_key()
                 
-            # Check for kill button
-            for template in self.templates['kill']:
-                if self.find_image_in_window(template['image']):
-                    msg = "Kill button detected"
-                    print(msg)
-                    self.gui.add_log_entry(msg)
-                    self.in_battle = True
-                    return "battle"
-                    
-            # Check for chose button
-            for template in self.templates['chose']:
-                if self.find_image_in_window(template['image']):
-                    msg = "Chose dialog detected"
-               #     print(msg)
-                    self.gui.add_log_entry(msg)
-                    self.in_battle = True
-                    # Handle the chose dialog
-                    self.check_for_chose()
-                    return "battle"
-                    
-            # Check for overload button
-            for template in self.templates['overload']:
-                if self.find_image_in_window(template['image']):
-                    msg = "Overload dialog detected"
-                    print(msg)
-                    self.gui.add_log_entry(msg)
-                    self.in_battle = True
-                    # Handle the overload dialog
-                    self.check_for_overload()
-                    return "battle"
-                    
-            # More detailed status for unknown state
-            if self.in_battle:
-                msg = "Loading battle..."
-                print(msg)
-                self.gui.add_log_entry(msg)
-                return "battle_loading"
-            
-            # If no specific state found, return loading
-            msg = "Loading..."
-            print(msg)
-            self.gui.add_log_entry(msg)
-            return "loading"
-            
-        except Exception as e:
-            msg = f"Error getting game state: {e}"
-            print(msg)
-            self.gui.add_log_entry(msg)
-            return "error"
+    # Template types checked per tick, in priority order: the map icon rules out
+    # every battle screen and death has the highest priority inside battles
+    SCREEN_PRIORITY = ['map', 'died', 'run', 'bag', 'kill', 'chose', 'overload']
+
+    def get_game_state(self, types=None):
+        """Classifies the current frame into one of state_machine.SCREENS
         
-    def find_image_in_window(self, template_image):
-        """Searches for the template image in the Temtem window using OpenCV"""
-        if not self.window_handle:
-            print("Not attached to Temtem window")
-            return False
+        Args:
+            types: Template types to check (default all), e.g. the watch list of the state
+        """
+        frame = self.snapshot.get()
+        if frame is None:
+            return "none"
+        
+        # All types run in parallel, lower priorities are cancelled after a hit
+        if types is None:
+            types = self.SCREEN_PRIORITY
+        else:
+            types = [t for t in self.SCREEN_PRIORITY if t in types]
+        
+        # A screen seen before skips template matching entirely, unless the
+        # periodic full-frame search of a type is due (the UI may have moved)
+        key, frame_hash = self._state_cache_key(frame, types)
+        if key is not None:
+            cached = self.state_cache.lookup(key, frame_hash)
+            fallback_due = cached is not None and not all(
+                [self.matcher.regions.count_search(template_type) for template_type, _ in key])
+            if cached is not None and not fallback_due:
+                state, result = cached
+                if result is not None:
+                    self._report_match(result, frame)
+                return state
+        
+        result = self.matcher.first_found(frame, types)
+        if result is None:
+            state = "none"
+        else:
+            self._report_match(result, frame)
+            state = "battle_menu" if result.type in ('run', 'bag') else result.type
+        if key is not None:
+            self.state_cache.store(key, frame_hash, state, result)
+        return state
+        
+    def _state_cache_key(self, frame, types):
+        """Returns (key, hash) of a frame for the state cache, or (None, None)
+        
+        The key holds the types and their learned areas, the hash covers just
+        those areas. Types without a learned area could appear anywhere, a
+        frame hash would miss them, so such frames are not cached.
+        """
+        if self.state_cache.size <= 0 or not self.matcher.regions:
+            return None, None
+        frame_size = (frame.width, frame.height)
+        key = []
+        hashes = []
+        for template_type in types:
+            if not self.registry.of_type(template_type):
+                continue
+            area = self.matcher.regions.area(template_type, frame_size)
+            if area is None or not frame.covers(*area):
+                return None, None
+            x1, y1, x2, y2 = area
+            key.append((template_type, area))
+            hashes.append(difference_hash(frame.pixels('gray')[y1:y2, x1:x2]))
+        if not key:
+            return None, None
+        return tuple(key), np.concatenate(hashes)
+        
+    def match(self, template, frame=None):
+        """Matches a template against a frame and returns the MatchResult
+        
+        Args:
+            template: Template type name (best template of that type), a
+                      CompiledTemplate or a PIL image from the templates
+            frame: Optional Frame to search, defaults to the shared tick snapshot
+            
+        Returns:
+            MatchResult (truthy if found), or None without frame or templates.
+            Results are cached per frame, repeated questions in one tick are free.
+        """
+        if frame is None:
+            if not self.frame_source.is_ready():
+                self._log("Not attached to Temtem window", WARNING, 'match')
+                return None
+            # Use the frame captured for this tick
+            frame = self.snapshot.get()
+        if frame is None:
+            return None
             
         try:
-            # Get correct screen coordinates
-            monitor = self.get_screen_coordinates(self.window_handle)
-            if not monitor:
-                return False
-                
-            try:
-                # Capture window content using MSS
-                sct = self._ensure_mss()
-                screenshot = sct.grab(monitor)
-                
-                # Convert MSS screenshot to OpenCV format
-                screenshot_cv = cv2.cvtColor(np.array(screenshot), cv2.COLOR_BGRA2BGR)
-                template_cv = cv2.cvtColor(np.array(template_image), cv2.COLOR_RGB2BGR)
-                
-                # Template matching with TM_SQDIFF_NORMED (lower value means better match)
-                result = cv2.matchTemplate(screenshot_cv, template_cv, cv2.TM_SQDIFF_NORMED)
-                min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-                
-                # Bei TM_SQDIFF_NORMED ist min_val der beste Match (0 = perfekt, 1 = keine Übereinstimmung)
-                confidence = 1.0 - min_val
-                
-                # Find template type and name
-                template_type = None
-                template_name = None
-                for t_type, templates in self.templates.items():
-                    for template in templates:
-                        if template['image'] is template_image:
-                            template_type = t_type
-                            template_name = template['name']
-                            break
-                    if template_type:
-                        break
-                
-                # Get threshold based on template type
-                threshold = self.thresholds.get(template_type, 0.95)  # Default to 0.95 if not found
-                
-                if confidence >= threshold:
-                    # Calculate position of found template
-                    h, w = template_cv.shape[:2]
-                    x = min_loc[0] + monitor["left"]
-                    y = min_loc[1] + monitor["top"]
-                    
-                    # Log the find with confidence
-                    if hasattr(self, 'gui'):
-                        self.gui.add_log_entry(f"{template_name} gefunden ({confidence:.2f})")
-                    
-                    # Show highlight
-                    self.highlight_match(x, y, w, h)
-                    return True
-                return False
-                    
-            except Exception as e:
-                import traceback
-                msg = f"Screenshot/matching error: {str(e)}"
-                print(msg)
-                self.gui.add_log_entry(msg)
-                print(traceback.format_exc())
-                self.gui.add_log_entry(traceback.format_exc())
-                return False
+            if isinstance(template, str):
+                result = self.matcher.best_of_type(frame, template)
+                return result if result.name is not None else None
+            if not isinstance(template, CompiledTemplate):
+                template = self._compile_image(template)
+            return self.matcher.match(frame, template)
             
         except Exception as e:
             import traceback
-            msg = f"Error during image recognition: {str(e)}"
-            print(msg)
-            self.gui.add_log_entry(msg)
-            print("Full error:")
-            print(traceback.format_exc())
-            self.gui.add_log_entry("Full error:")
-            self.gui.add_log_entry(traceback.format_exc())
-            return False
+            self._log(f"Error during image recognition: {str(e)}", ERROR, 'match')
+            self._log("Full error:\n" + traceback.format_exc(), ERROR, 'match')
+            return None
+        
+    def grab_full_frame(self):
+        """Captures the whole client area into a new Frame
+        
+        For the settings tests: the tick snapshot and the capture buffers of
+        the bot loop are not touched.
+        """
+        if not self.frame_source.is_ready():
+            return None
+        captured = self.frame_source.grab()
+        if not captured:
+            return None
+        image, monitor = captured[:2]
+        return Frame(image, monitor, 0, self.clock.time())
+        
+    def test_match(self, template, frame):
+        """Plain full-frame match of one template for the threshold test
+        
+        No search region, known-location shortcut, result reuse or hit
+        recording - the caller compares the confidence with its own threshold.
+        
+        Args:
+            template: CompiledTemplate or a PIL image from the templates
+            frame: Full Frame to search
+            
+        Returns:
+            Tuple (confidence, (x, y), (width, height)) in frame coordinates
+        """
+        if not isinstance(template, CompiledTemplate):
+            template = self._compile_image(template)
+        confidence, location = match_template(frame.pixels(template.mode), template)
+        return confidence, location, (template.width, template.height)
+        
+    def compare_match_modes(self, template, frame):
+        """Returns the confidence of a template in every match mode
+        
+        Used by the settings test to show what grayscale or single-channel
+        matching would change. Always a full-frame search, nothing is cached.
+        
+        Args:
+            template: CompiledTemplate or a PIL image from the templates
+            frame: Full Frame to search
+            
+        Returns:
+            Dictionary match mode -> confidence
+        """
+        if not isinstance(template, CompiledTemplate):
+            template = self._compile_image(template)
+        return {mode: match_template(frame.pixels(mode), template, mode)[0] for mode in MATCH_MODES}
+        
+    def _report_match(self, result, frame):
+        """Logs a find and highlights it on screen"""
+        # Calculate position of found template
+        x = result.x + frame.monitor["left"]
+        y = result.y + frame.monitor["top"]
+        
+        # Log the find with confidence (rate limited, it repeats every tick)
+        self._log(f"{result.name} gefunden ({result.confidence:.2f})", category='match')
+        
+        # Show highlight
+        self.highlight_match(x, y, result.w, result.h)
+        
+    def _compile_image(self, template_image):
+        """Returns the compiled registry entry for a raw PIL template image"""
+        entry = self.registry.lookup_image(template_image)
+        if entry is None:
+            # Unknown image (not from set_templates) - compile it ad hoc
+            entry = CompiledTemplate('unknown', 'unknown', template_image, DEFAULT_THRESHOLD)
+        return entry
         
     def set_templates(self, template_groups):
         """Sets templates for all types based on the template groups
@@ -846,159 +889,11 @@ class AutoLeveler:
         for template_type, templates in template_groups.items():
             if template_type in self.templates:
                 self.templates[template_type].extend(templates)
-
-    def can_battle_action(self):
-        """Checks if we can take a battle action (Run or Bag button visible)"""
-        # Check for run button
-        for template in self.templates['run']:
-            if self.find_image_in_window(template['image']):
-                return True
-        
-        # Check for bag button
-        for template in self.templates['bag']:
-            if self.find_image_in_window(template['image']):
-                return True
-        
-        return False
-            
-    def check_for_kill(self):
-        """Checks if any kill button is visible"""
-        if not self.running:
-            return False
-        
-        for template in self.templates['kill']:
-            if self.find_image_in_window(template['image']):
-                if not self.running:
-                    return False
-                print("Kill button found - sending F")
-                self.send_key_to_window('f')
-                return True
-        
-        return False
-           
-    def check_for_chose(self):
-        """Checks if the chose button is visible"""
-        if not self.running:
-            return False
-        
-        # Track chose dialogs in last 20 seconds
-        current_time = time.time()
-        if not hasattr(self, 'chose_detections'):
-            self.chose_detections = []
-        
-        # Remove old detections
-        self.chose_detections = [t for t in self.chose_detections if current_time - t < 20]
-        
-        for template in self.templates['chose']:
-            if self.find_image_in_window(template['image']):
-                if not self.running:
-                    return False
-                    
-                # Add detection time
-                self.chose_detections.append(current_time)
-                msg = f"Chose dialog detected (Total in last 20s: {len(self.chose_detections)})"
-                print(msg)
-                self.gui.add_log_entry(msg)
-                
-                # If we detect too many chose dialogs in short time, something is stuck
-                if len(self.chose_detections) >= 5:
-                    msg = "Chose dialog stuck - using right-click fallback"
-                    print(msg)
-                    self.gui.add_log_entry(msg)
-                    
-                    # Try right click up to 3 times
-                    for attempt in range(3):
-                        if self.send_mouse_click(right_click=True):
-                            # Wait a bit and check if dialog is gone
-                            time.sleep(0.5)
-                            if not self.find_image_in_window(template['image']):
-                                msg = "Fallback successful - dialog cleared"
-                                print(msg)
-                                self.gui.add_log_entry(msg)
-                                self.chose_detections = []
-                                return True
-                            else:
-                                msg = f"Fallback attempt {attempt + 1} failed - dialog still present"
-                                print(msg)
-                                self.gui.add_log_entry(msg)
-                                time.sleep(0.5)  # Wait before next attempt
-                    
-                    msg = "All fallback attempts failed"
-                    print(msg)
-                    self.gui.add_log_entry(msg)
-                    return False
-                
-                # Normal case - try F key
-                print("Chose button found - sending F")
-                self.send_key_to_window('f')
                 
-                # Wait a bit and verify the dialog is gone
-                time.sleep(0.5)
-                if not self.find_image_in_window(template['image']):
-                    msg = "F key successful - dialog cleared"
-                    print(msg)
-                    self.gui.add_log_entry(msg)
-                    return True
-                else:
-                    msg = "F key failed - dialog still present"
-                    print(msg)
-                    self.gui.add_log_entry(msg)
-                    return False
-        
-        return False
-        
-    def check_for_overload(self):
-        """Checks if the overload button is visible"""
-        if not self.running:
-            return False
-        
-        for template in self.templates['overload']:
-            if self.find_image_in_window(template['image']):
-                if not self.running:
-                    return False
-                print("Overload button found - sending 6")
-                self.send_key_to_window('6')
-                return True
-        
-        return False
-        
-    def check_for_death(self):
-        """Checks if the died screen is visible and handles it"""
-        if not self.running:
-            return False
-        
-        for template in self.templates['died']:
-            if self.find_image_in_window(template['image']):
-                if not self.running:
-                    return False
-                print("Death detected - attempting recovery")
-                self.death_retry_count += 1
-                
-                # Try recovery sequence up to 5 times
-                if self.death_retry_count <= 5:
-                    print(f"Death recovery attempt {self.death_retry_count}/5")
-                    self.gui.add_log_entry(f"Death recovery attempt {self.death_retry_count}/5")
-                    # Press W then F
-                    self.send_key_to_window('w')
-                    if not self.running:
-                        return False
-                    time.sleep(0.2)
-                    if not self.running:
-                        return False
-                    self.send_key_to_window('f')
-                    time.sleep(0.2)
-                    return True
-                else:
-                    msg = "Max death retries reached"
-                    print(msg)
-                    self.gui.add_log_entry(msg)
-                    self.death_retry_count = 0
-                    return False
-        
-        # Reset counter if we're not dead
-        self.death_retry_count = 0
-        return False
-       
+        # Compile once so the hot loop does no conversion or lookup
+        self.registry.build(self.templates, self.thresholds, self.match_strategies, self.match_modes)
+        self.state_cache.clear()
+
     def set_highlight_enabled(self, enabled):
         """Enables or disables the highlight system"""
         self.highlight_enabled = enabled
@@ -1030,26 +925,17 @@ class AutoLeveler:
             x = monitor["left"] + monitor["width"] // 2
             y = monitor["top"] + monitor["height"] // 2
             
-            # Set cursor position
-            win32api.SetCursorPos((x, y))
-            
-            # Send click
-            if right_click:
-                win32api.mouse_event(win32con.MOUSEEVENTF_RIGHTDOWN, x, y, 0, 0)
-                time.sleep(0.1)
-                win32api.mouse_event(win32con.MOUSEEVENTF_RIGHTUP, x, y, 0, 0)
-            else:
-                win32api.mouse_event(win32con.MOUSEEVENTF_LEFTDOWN, x, y, 0, 0)
-                time.sleep(0.1)
-                win32api.mouse_event(win32con.MOUSEEVENTF_LEFTUP, x, y, 0, 0)
-            
+            # Move there and click, in the same focus cycle as queued keys
+            self.input.click(x, y, right=right_click)
             return True
             
         except Exception as e:
-            print(f"Error sending mouse click: {e}")
+            self._log(f"Error sending mouse click: {e}", ERROR, 'input')
             return False
 
     def __del__(self):
-        """Cleanup MSS when object is destroyed"""
-        if hasattr(self._thread_local, 'sct'):
-            self._thread_local.sct.close()
+        """Cleanup capture and matcher threads when object is destroyed"""
+        if hasattr(self, 'frame_source'):
+            self.frame_source.close()
+        if hasattr(self, 'matcher'):
+            self.matcher.close()
@@ -6,17 +6,16 @@ from PIL import Image
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QVBoxLayout, 
                            QWidget, QLabel, QGroupBox, QComboBox, QMessageBox,
                            QFileDialog, QRadioButton, QHBoxLayout, QCheckBox)
-from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QFont
 from datetime import datetime
 from autolevel import AutoLeveler
-import win32api
-import win32gui
+from bot_logging import INFO, LogStore
+
+# Milliseconds between two deliveries of new log entries to the log view
+LOG_FLUSH_INTERVAL = 250
 
 class AutoLevelGUI(QMainWindow):
-    # Signal for log updates
-    log_signal = pyqtSignal(str)
-    
     def __init__(self):
         super().__init__()
         self.battle_count = 0
@@ -30,11 +29,14 @@ class AutoLevelGUI(QMainWindow):
         self.settings_window = None  # Stores reference to settings window
         
         # Log system
-        self.log_entries = []  # List for last 15 logs
         self.max_logs = 100  # Maximum number of logs
+        self.log_store = LogStore(self.max_logs)  # Newest log lines with sequence numbers
+        self._last_log_entry = None  # LogEntry behind the newest line (grows when folded)
         
-        # Connect log signal
-        self.log_signal.connect(self._add_log_entry)
+        # New log entries are fetched from the bot's logger in batches
+        self.log_timer = QTimer()
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(LOG_FLUSH_INTERVAL)
         
         # Initialize highlight system
         self.bot.setup_highlight()
@@ -104,12 +106,10 @@ class AutoLevelGUI(QMainWindow):
         self.images = {}
         img_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'img')
         msg = f"Loading images from directory: {img_dir}"
-        print(msg)
         self.add_log_entry(msg)
         
         if not os.path.exists(img_dir):
             msg = f"Warning: Image directory {img_dir} does not exist!"
-            print(msg)
             self.add_log_entry(msg)
             return
             
@@ -122,18 +122,14 @@ class AutoLevelGUI(QMainWindow):
                     # Store only with the full filename (including extension)
                     self.images[filename] = image
                     msg = f"Loaded image: {filename}"
-                    print(msg)
                     self.add_log_entry(msg)
                 except Exception as e:
                     msg = f"Error loading image {filename}: {str(e)}"
-                    print(msg)
                     self.add_log_entry(msg)
                     
         msg = f"Total images loaded: {len(self.images)}"
-        print(msg)
         self.add_log_entry(msg)
         msg = f"Available image keys: {list(self.images.keys())}"
-        print(msg)
         self.add_log_entry(msg)
         
     def initUI(self):
@@ -461,6 +457,21 @@ class AutoLevelGUI(QMainWindow):
         profile_layout.addWidget(self.profile_label)
         stats_layout.addWidget(profile_row)
         
+        # State cache hits (horizontal)
+        cache_row = QWidget()
+        cache_layout = QHBoxLayout(cache_row)
+        cache_layout.setContentsMargins(0, 0, 0, 0)
+        
+        cache_title = QLabel("State cache:")
+        cache_title.setFont(title_font)
+        self.cache_label = QLabel("0 hits / 0 misses")
+        self.cache_label.setFont(value_font)
+        self.cache_label.setAlignment(Qt.AlignRight)
+        
+        cache_layout.addWidget(cache_title)
+        cache_layout.addWidget(self.cache_label)
+        stats_layout.addWidget(cache_row)
+        
         stats_group.setLayout(stats_layout)
         content_layout.addWidget(stats_group)
         
@@ -563,15 +574,19 @@ class AutoLevelGUI(QMainWindow):
                 battles_per_hour = self.battle_count / hours_total
                 self.battles_per_hour_label.setText(f"{battles_per_hour:.1f}")
         
+        # Update state cache counters
+        cache = self.bot.state_cache
+        self.cache_label.setText(f"{cache.hits} hits / {cache.misses} misses ({cache.hit_rate * 100:.0f}%)")
+        
         # Detailed status without timestamp
-        if self.bot.current_state == "map":
+        if self.bot.current_state == "overworld":
             self.set_status_text("On map")
         elif self.bot.in_battle:
             self.set_status_text("In battle")
+        elif self.bot.current_state == "loading":
+            self.set_status_text("Loading")
         elif self.bot.current_state == "unknown":
             self.set_status_text("Unknown")
-        elif self.bot.current_state == "error":
-            self.set_status_text("Error")
     
     def set_status_text(self, text):
         """Sets the status text and removes line breaks"""
@@ -601,7 +616,6 @@ class AutoLevelGUI(QMainWindow):
             # Group templates by type
             template_groups = {}
             msg = "\nLoading templates:"
-            print(msg)
             self.add_log_entry(msg)
             for filename, image in self.images.items():
                 # Only process filenames with extension
@@ -614,7 +628,6 @@ class AutoLevelGUI(QMainWindow):
                 template_type = template_type.rstrip('_')  # Remove trailing underscores
                 
                 msg = f"File: {filename} -> Type: {template_type}"
-                print(msg)
                 self.add_log_entry(msg)
                 
                 if template_type not in template_groups:
@@ -626,17 +639,14 @@ class AutoLevelGUI(QMainWindow):
                 })
             
             msg = f"\nRequired types: {required_types}"
-            print(msg)
             self.add_log_entry(msg)
             msg = f"Found types: {list(template_groups.keys())}"
-            print(msg)
             self.add_log_entry(msg)
             
             # Check required template types
             missing_types = [t for t in required_types if t not in template_groups]
             if missing_types:
                 error_msg = f"Error: Missing template types: {', '.join(missing_types)}"
-                print(error_msg)
                 self.add_log_entry(error_msg)
                 self.set_status_text(error_msg)
                 return
@@ -644,7 +654,6 @@ class AutoLevelGUI(QMainWindow):
             # If no died templates were found, output a warning
             if 'died' not in template_groups:
                 msg = "Warning: No died templates found - death detection disabled"
-                print(msg)
                 self.add_log_entry(msg)
                 template_groups['died'] = []  # Empty list for died templates
                 
@@ -742,8 +751,8 @@ class AutoLevelGUI(QMainWindow):
             
         try:
             # Get Temtem window position and size
-            temtem_rect = win32gui.GetWindowRect(self.bot.window_handle)
-            screen_width = win32api.GetSystemMetrics(0)  # Screen width
+            temtem_rect = self.bot.window_backend.window_rect(self.bot.window_handle)
+            screen_width = self.bot.window_backend.screen_size()[0]  # Screen width
             
             # GUI size
             gui_width = self.width()
@@ -764,15 +773,7 @@ class AutoLevelGUI(QMainWindow):
         try:
             if self.bot.attach_to_window():
                 # Get monitor info
-                monitor = win32api.MonitorFromWindow(self.bot.window_handle)
-                monitors = win32api.EnumDisplayMonitors()
-                monitor_number = 1  # Default to 1 if we can't determine
-                
-                # Try to find the monitor number
-                for i, m in enumerate(monitors):
-                    if m[0] == monitor:
-                        monitor_number = i + 1
-                        break
+                monitor_number = self.bot.window_backend.monitor_number(self.bot.window_handle)
                 
                 self.monitor_label.setText(f"Monitor {monitor_number}")
                 self.set_status_text("Attached to Temtem")
@@ -1193,15 +1194,7 @@ class AutoLevelGUI(QMainWindow):
             try:
                 if self.bot.attach_to_window():
                     # Get monitor info
-                    monitor = win32api.MonitorFromWindow(self.bot.window_handle)
-                    monitors = win32api.EnumDisplayMonitors()
-                    monitor_number = 1  # Default to 1 if we can't determine
-                    
-                    # Try to find the monitor number
-                    for i, m in enumerate(monitors):
-                        if m[0] == monitor:
-                            monitor_number = i + 1
-                            break
+                    monitor_number = self.bot.window_backend.monitor_number(self.bot.window_handle)
                     
                     self.monitor_label.setText(f"Monitor {monitor_number}")
                     self.set_status_text("Attached to Temtem")
@@ -1214,34 +1207,38 @@ class AutoLevelGUI(QMainWindow):
                     self.dock_gui()
                 else:
                     msg = "Temtem not found - Starting without connection"
-                    print(msg)
                     self.add_log_entry(msg)
             except Exception as e:
                 msg = f"Auto-attach error: {e}"
-                print(msg)
                 self.add_log_entry(msg)
 
-    def add_log_entry(self, message):
-        """Adds a new log entry via the signal"""
-        self.log_signal.emit(message)
-        
-    def _add_log_entry(self, message):
-        """Actual implementation of log addition (executed in GUI thread)"""
-        timestamp = datetime.now().strftime('%H:%M:%S')
-        entry = f"[{timestamp}] {message}"
-        
-        # Add new entry and keep only newest max_logs
-        self.log_entries.append(entry)
-        if len(self.log_entries) > self.max_logs:
-            self.log_entries.pop(0)
+    def add_log_entry(self, message, level=INFO):
+        """Logs a message of the GUI (thread safe, shown with the next batch)"""
+        self.bot.logger.log(message, level, 'gui')
+        
+    def flush_log(self):
+        """Takes the new log entries from the bot's logger (executed in GUI thread)"""
+        entries = self.bot.logger.drain()
+        if not entries:
+            return
+            
+        for log_entry in entries:
+            timestamp = datetime.fromtimestamp(log_entry.timestamp).strftime('%H:%M:%S')
+            entry = f"[{timestamp}] {log_entry.text}"
+            if log_entry is self._last_log_entry:
+                # Repeated message, only its count changed
+                self.log_store.replace_last(entry)
+            else:
+                self.log_store.append(entry)
+                self._last_log_entry = log_entry
             
-        # Update Settings GUI if open
+        # Update Settings GUI if open, once per batch
         if self.settings_window and hasattr(self.settings_window, 'update_log_display'):
             self.settings_window.update_log_display()
             
     def get_log_entries(self):
         """Returns the current log entries"""
-        return self.log_entries.copy()  # Return copy to ensure thread safety
+        return self.log_store.lines()
 
     def on_highlight_changed(self, state):
         """Called when highlight setting changes"""
@@ -0,0 +1,204 @@
+import argparse
+import contextlib
+import io
+import os
+import time
+import tracemalloc
+import mss
+from clock import VirtualClock
+from config_manager import ConfigManager
+from frame_capture import FrameSnapshot, MSSFrameSource, open_frame_source
+from input_backend import INPUT_BACKENDS
+from game_simulator import GameSimulator, SimulatedAutoLeveler, load_template_groups
+from template_matcher import match_template, match_template_pyramid, PYRAMID_LEVELS
+from template_registry import TemplateRegistry
+
+
+def load_frames(path=None, limit=None):
+    """Loads recorded frames (directory, .npz or video), or the simulator screens"""
+    if path is None:
+        return list(GameSimulator(seed=0).screens.values())
+    source = open_frame_source(path)
+    frames = []
+    try:
+        while source.is_ready() and (limit is None or len(frames) < limit):
+            grabbed = source.grab()
+            if grabbed is None:
+                break
+            frames.append(grabbed[0])
+    finally:
+        source.close()
+    return frames
+
+
+def benchmark(frames, registry, levels=PYRAMID_LEVELS, repeat=1):
+    """Matches every template on every frame with both strategies
+
+    Returns:
+        Dictionary per template type with the timings of both strategies and how
+        well the pyramid results agree with the single-scale reference
+    """
+    stats = {}
+    for template in registry:
+        entry = stats.setdefault(template.type, {
+            'single_time': 0.0, 'pyramid_time': 0.0, 'matches': 0,
+            'same_decision': 0, 'confidence_diff': 0.0, 'max_confidence_diff': 0.0,
+            'hits': 0, 'same_location': 0
+        })
+        for image in frames:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                single_conf, single_loc = match_template(image, template)
+            entry['single_time'] += (time.perf_counter() - start) / repeat
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                pyramid_conf, pyramid_loc = match_template_pyramid(image, template, levels)
+            entry['pyramid_time'] += (time.perf_counter() - start) / repeat
+
+            diff = abs(single_conf - pyramid_conf)
+            entry['matches'] += 1
+            entry['same_decision'] += (single_conf >= template.threshold) == (pyramid_conf >= template.threshold)
+            entry['confidence_diff'] += diff
+            entry['max_confidence_diff'] = max(entry['max_confidence_diff'], diff)
+            # Only hits have a meaningful location
+            if single_conf >= template.threshold:
+                entry['hits'] += 1
+                entry['same_location'] += single_loc == pyramid_loc
+    return stats
+
+
+def measure_capture_allocations(source, count=50):
+    """Measures the memory allocated per capture with tracemalloc
+
+    Captures go through a FrameSnapshot like in the bot, so frame buffers are
+    reused once warmed up. Returns (mean, max) bytes allocated per capture on
+    top of what stays alive, i.e. the allocation churn of the capture path.
+    """
+    snapshot = FrameSnapshot(source.grab)
+    return _measure_allocations(snapshot.refresh, count)
+
+
+def measure_tick_allocations(count=50, seed=0):
+    """Measures the memory allocated per bot tick on the simulator with tracemalloc
+
+    A tick is what the bot loop does per frame: refresh the snapshot and
+    classify the screen with get_game_state(), including the grayscale and
+    downscaled images of the frame. Returns (mean, max) bytes per tick.
+    """
+    clock = VirtualClock()
+    simulator = GameSimulator(seed=seed, clock=clock)
+    # The bot prints every decision - keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        bot = SimulatedAutoLeveler(simulator)
+        bot.highlight_enabled = False
+        bot.set_templates(load_template_groups(simulator.img_dir))
+
+        def tick():
+            clock.advance(0.1)
+            bot.snapshot.refresh()
+            bot.get_game_state()
+        try:
+            return _measure_allocations(tick, count)
+        finally:
+            bot.matcher.close()
+
+
+def _measure_allocations(func, count, warmup=3):
+    """Returns (mean, max) bytes allocated by one call of func"""
+    # The first calls allocate the buffers
+    for _ in range(warmup):
+        func()
+    sizes = []
+    try:
+        for _ in range(count):
+            # Restarting clears the peak (tracemalloc.reset_peak needs Python 3.9)
+            tracemalloc.start()
+            func()
+            sizes.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    finally:
+        tracemalloc.stop()
+    return sum(sizes) / len(sizes), max(sizes)
+
+
+def measure_input_cost(backend, count=100, key='shift'):
+    """Measures the time per key event of an input backend
+
+    Sends count key down/up pairs of a harmless key to whatever window has
+    the focus. Returns (mean, max) seconds per event.
+    """
+    times = []
+    for _ in range(count):
+        for send in (backend.key_down, backend.key_up):
+            start = time.perf_counter()
+            send(key)
+            times.append(time.perf_counter() - start)
+    return sum(times) / len(times), max(times)
+
+
+def format_report(stats):
+    """Formats the benchmark statistics as a table"""
+    lines = [f"{'type':10s} {'single ms':>10s} {'pyramid ms':>10s} {'speedup':>8s} "
+             f"{'agree':>7s} {'same loc':>8s} {'mean dconf':>10s} {'max dconf':>10s}"]
+    total_single = total_pyramid = 0.0
+    for template_type, entry in sorted(stats.items()):
+        n = entry['matches']
+        same_location = f"{entry['same_location']}/{entry['hits']}"
+        total_single += entry['single_time']
+        total_pyramid += entry['pyramid_time']
+        lines.append(
+            f"{template_type:10s} {entry['single_time'] / n * 1000:10.2f} {entry['pyramid_time'] / n * 1000:10.2f} "
+            f"{entry['single_time'] / max(entry['pyramid_time'], 1e-9):7.1f}x "
+            f"{entry['same_decision'] / n * 100:6.1f}% {same_location:>8s} {entry['confidence_diff'] / n:10.4f} "
+            f"{entry['max_confidence_diff']:10.4f}")
+    lines.append(f"Total speedup: {total_single / max(total_pyramid, 1e-9):.1f}x")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compares single-scale and pyramid template matching on recorded frames")
+    parser.add_argument('frames', nargs='?', default=None,
+                        help="Screenshot directory, .npz archive or video (default: simulator screens)")
+    parser.add_argument('--img', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'img'),
+                        help="Template directory")
+    parser.add_argument('--levels', type=int, default=PYRAMID_LEVELS, help="Coarse pyramid level")
+    parser.add_argument('--limit', type=int, default=None, help="Maximum number of frames")
+    parser.add_argument('--repeat', type=int, default=1, help="Repetitions per measurement")
+    parser.add_argument('--allocations', action='store_true',
+                        help="Measure the allocations per capture (live primary screen by default) and per bot tick instead")
+    parser.add_argument('--input', choices=sorted(INPUT_BACKENDS), default=None,
+                        help="Measure the time per key event of an input backend instead")
+    parser.add_argument('--key', default='shift', help="Key sent by the input measurement")
+    args = parser.parse_args()
+
+    if args.input:
+        backend = INPUT_BACKENDS[args.input]()
+        try:
+            mean, peak = measure_input_cost(backend, args.limit or 100, args.key)
+        finally:
+            backend.close()
+        print(f"{args.input}: mean {mean * 1000:.3f} ms, max {peak * 1000:.3f} ms per event")
+        raise SystemExit(0)
+
+    if args.allocations:
+        if args.frames:
+            source = open_frame_source(args.frames, loop=True)
+        else:
+            with mss.mss() as sct:
+                primary = dict(sct.monitors[1])
+            source = MSSFrameSource(lambda: primary)
+        mean, peak = measure_capture_allocations(source, args.limit or 50)
+        source.close()
+        print(f"Allocated per capture: mean {mean / 1024:.1f} KiB, max {peak / 1024:.1f} KiB")
+        mean, peak = measure_tick_allocations(args.limit or 50)
+        print(f"Allocated per simulator tick: mean {mean / 1024:.1f} KiB, max {peak / 1024:.1f} KiB")
+        raise SystemExit(0)
+
+    registry = TemplateRegistry()
+    # Thresholds of the default profile decide what counts as a hit
+    registry.build(load_template_groups(args.img), ConfigManager.DEFAULT_CONFIG['profiles']['Default']['thresholds'])
+    frames = load_frames(args.frames, args.limit)
+    print(f"{len(frames)} frames, {len(registry)} templates")
+    print(format_report(benchmark(frames, registry, args.levels, args.repeat)))
@@ -0,0 +1,239 @@
+import threading
+import time
+from collections import deque
+from clock import SystemClock
+
+# Log levels, same values as the logging module
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: 'debug', INFO: 'info', WARNING: 'warning', ERROR: 'error'}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+# Entries per second and category, warnings and errors are never limited.
+# Template finds are logged on every tick the template is visible.
+DEFAULT_RATE_LIMITS = {'match': 2.0}
+
+# Entries kept for delivery while nobody drains them (e.g. no GUI)
+DEFAULT_PENDING_SIZE = 1000
+
+
+class LogEntry:
+    """One log line, repeated `count` times in a row"""
+
+    __slots__ = ('timestamp', 'level', 'category', 'message', 'count')
+
+    def __init__(self, timestamp, level, category, message):
+        self.timestamp = timestamp  # Wall-clock time of the first occurrence
+        self.level = level
+        self.category = category
+        self.message = message
+        self.count = 1
+
+    @property
+    def text(self):
+        """The message, with the repetitions folded in ("On map ×240")"""
+        if self.count > 1:
+            return f"{self.message} ×{self.count}"
+        return self.message
+
+    def __repr__(self):
+        return f"LogEntry({LEVEL_NAMES.get(self.level, self.level)}, {self.category}, {self.text!r})"
+
+
+class BotLogger:
+    """Log pipeline of the bot: levels, categories, folding and rate limits
+
+    A message identical to the previous one (same level, category and text)
+    only increases the count of the previous entry. Every category can have
+    a maximum rate in entries per second; what is over the limit is counted
+    and reported in one line once the next second starts. Entries are not
+    pushed to the GUI, it drains them in batches on a timer (drain()). An
+    entry that is drained again means its count has grown since.
+    """
+
+    def __init__(self, clock=None, level=INFO, rate_limits=None, console=True,
+                 pending_size=DEFAULT_PENDING_SIZE):
+        """Creates the logger
+
+        Args:
+            clock: Clock for the rate limits (timestamps are always wall-clock)
+            level: Minimum level of the entries kept
+            rate_limits: Dictionary category -> entries per second
+            console: Print new entries (a folded run once it ends)
+            pending_size: Maximum entries waiting for drain(), the oldest are dropped
+        """
+        self.clock = clock or SystemClock()
+        self.level = level
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits)
+        self.console = console
+        self._pending = deque(maxlen=pending_size)
+        self._last = None
+        self._last_pending = False  # _last changed since the last drain
+        self._windows = {}  # category -> [window start, entries in window, suppressed]
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.received = 0    # log() calls at or above the level
+        self.emitted = 0     # New entries
+        self.folded = 0      # Repetitions folded into the previous entry
+        self.suppressed = 0  # Entries over a rate limit
+
+    def configure(self, level=None, rate_limits=None):
+        """Applies profile settings"""
+        with self._lock:
+            if level is not None:
+                self.level = LEVELS.get(level, level) if isinstance(level, str) else level
+            if rate_limits is not None:
+                self.rate_limits = dict(rate_limits)
+                self._windows.clear()
+
+    def log(self, message, level=INFO, category='general'):
+        """Logs one message"""
+        if level < self.level:
+            return
+        message = str(message)
+        printed = []
+        with self._lock:
+            self.received += 1
+            last = self._last
+            if (last is not None and last.message == message and last.category == category
+                    and last.level == level):
+                last.count += 1
+                self.folded += 1
+                if not self._last_pending:
+                    self._last_pending = True
+                    self._pending.append(last)
+                return
+            if level < WARNING and not self._allow(category, printed):
+                self.suppressed += 1
+                return
+            self._add(LogEntry(time.time(), level, category, message), printed)
+        # Print outside the lock, the console can be slow
+        if self.console:
+            for line in printed:
+                print(line)
+
+    def _allow(self, category, printed):
+        """Counts an entry against the rate limit of its category"""
+        limit = self.rate_limits.get(category)
+        if not limit:
+            return True
+        now = self.clock.time()
+        window = self._windows.get(category)
+        if window is None or now - window[0] >= 1.0:
+            # A new second starts, report what the last one suppressed
+            if window is not None and window[2]:
+                self._add(LogEntry(time.time(), INFO, category,
+                                   f"({window[2]} {category} messages suppressed)"), printed)
+            window = self._windows[category] = [now, 0, 0]
+        if window[1] >= limit:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+    def _add(self, entry, printed):
+        # A folded run ends, print how often it repeated
+        if self._last is not None and self._last.count > 1:
+            printed.append(self._last.text)
+        self._last = entry
+        self._last_pending = True
+        self._pending.append(entry)
+        self.emitted += 1
+        printed.append(entry.text)
+
+    def debug(self, message, category='general'):
+        self.log(message, DEBUG, category)
+
+    def info(self, message, category='general'):
+        self.log(message, INFO, category)
+
+    def warning(self, message, category='general'):
+        self.log(message, WARNING, category)
+
+    def error(self, message, category='general'):
+        self.log(message, ERROR, category)
+
+    def drain(self):
+        """Returns the entries logged or grown since the last call, oldest first"""
+        with self._lock:
+            entries = list(self._pending)
+            self._pending.clear()
+            self._last_pending = False
+        return entries
+
+
+class LogStore:
+    """Fixed-capacity ring buffer of log lines with sequence numbers
+
+    Every line gets the next sequence number, so a view only has to render
+    what is newer than the last number it has seen (since()). Replacing the
+    newest line (a folded message whose count grew) stores it again under a
+    new number but keeps its line id, the first number it was stored with,
+    so a view can tell that its last line changed. Line breaks inside a
+    message are collapsed, so one stored line is always one line of a view
+    and rewriting the last line never leaves part of a message behind.
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self._lines = deque(maxlen=capacity)  # (sequence, line id, text)
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    @property
+    def last_sequence(self):
+        """Sequence number of the newest line, 0 while empty"""
+        return self._sequence
+
+    def append(self, text):
+        """Adds a line, returns its sequence number"""
+        text = _single_line(text)
+        with self._lock:
+            self._sequence += 1
+            self._lines.append((self._sequence, self._sequence, text))
+            return self._sequence
+
+    def replace_last(self, text):
+        """Replaces the newest line, returns its new sequence number"""
+        text = _single_line(text)
+        with self._lock:
+            if not self._lines:
+                line_id = None
+            else:
+                _, line_id, _ = self._lines.pop()
+            self._sequence += 1
+            self._lines.append((self._sequence, line_id or self._sequence, text))
+            return self._sequence
+
+    def since(self, sequence):
+        """Returns the (sequence, line id, text) entries newer than sequence"""
+        with self._lock:
+            if sequence >= self._sequence:
+                return []
+            # The newest entries are at the end, walk back only as far as needed
+            newer = []
+            for entry in reversed(self._lines):
+                if entry[0] <= sequence:
+                    break
+                newer.append(entry)
+            newer.reverse()
+            return newer
+
+    def lines(self):
+        """Returns all stored lines, oldest first"""
+        with self._lock:
+            return [text for _, _, text in self._lines]
+
+    def __len__(self):
+        return len(self._lines)
+
+
+def _single_line(text):
+    """Joins the lines of a multi-line message with " | " """
+    if '\n' not in text and '\r' not in text:
+        return text
+    return ' | '.join(line for line in text.splitlines() if line.strip())
@@ -0,0 +1,64 @@
+import threading
+import time
+
+
+class SystemClock:
+    """Real wall-clock time, used by the bot in normal operation"""
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class ScaledClock:
+    """Accelerated time: every second of real time counts as `speed` seconds
+
+    Waits shrink by the same factor, while the real cost of capture and
+    matching is scaled up with them, so timing-sensitive behaviour stays
+    comparable to a real session.
+    """
+
+    def __init__(self, speed=10.0, start=None):
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+        self.speed = speed
+        self._real_start = time.time()
+        self._start = self._real_start if start is None else start
+
+    def time(self):
+        return self._start + (time.time() - self._real_start) * self.speed
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds / self.speed)
+
+
+class VirtualClock:
+    """Instant virtual time: sleep() advances the clock without waiting
+
+    Computation is free in virtual time, so only the bot's own waits and the
+    simulated game's timers make time pass. Used to replay long sessions in
+    seconds with the same decision logic.
+    """
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def time(self):
+        with self._lock:
+            return self._now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+        # Let other threads (e.g. the harness) observe the new time
+        time.sleep(0)
+
+    def advance(self, seconds):
+        """Moves virtual time forward"""
+        if seconds > 0:
+            with self._lock:
+                self._now += seconds
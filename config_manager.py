@@ -1,3 +1,4 @@
+import copy
 import json
 import os
 from typing import Dict, Any
@@ -23,6 +24,12 @@ class ConfigManager:
                     "overload": 0.7,
                     "died": 0.8,
                     "map": 0.95
+                },
+                "timings": {
+                    "after_attack_key": 0.3,
+                    "after_confirm_key": 0.3,
+                    "confirm_timeout": 1.0,
+                    "ui_timeout": 5.0
                 }
             }
         }
@@ -205,4 +212,27 @@ class ConfigManager:
             needs_save = True
             
         if needs_save:
-            self.save_config() 
\ No newline at end of file
+            self.save_config() 
+
+
+class MemoryConfigManager(ConfigManager):
+    """Configuration that lives only in memory, for simulations and benchmarks
+
+    Not a singleton: every instance starts from the defaults (or the given
+    configuration) and never reads or writes config.json, so a run is
+    reproducible and leaves the user's settings alone.
+    """
+
+    def __new__(cls, config=None):
+        return object.__new__(cls)
+
+    def __init__(self, config=None):
+        self._config = copy.deepcopy(config if config is not None else self.DEFAULT_CONFIG)
+
+    def load_config(self) -> None:
+        """Resets the configuration to the defaults"""
+        self._config = copy.deepcopy(self.DEFAULT_CONFIG)
+
+    def save_config(self) -> None:
+        """Nothing to save, the configuration is kept in memory only"""
+        pass
@@ -0,0 +1,642 @@
+import os
+import threading
+import weakref
+import numpy as np
+import cv2
+import mss
+from bot_logging import ERROR
+from clock import SystemClock
+from template_registry import convert_pixels
+
+
+class Frame:
+    """A single converted capture of the Temtem client area"""
+
+    def __init__(self, image, monitor, frame_id, timestamp, regions=None):
+        self.image = image          # BGR numpy array of the client area
+        self.monitor = monitor      # MSS monitor dict the frame was grabbed from
+        self.frame_id = frame_id    # Increasing id, unique per snapshot
+        self.timestamp = timestamp  # Clock time of the grab
+        self.regions = regions      # Captured (x1, y1, x2, y2) rects, None for the full area
+        self._converted = {}        # Match mode -> converted image, built on demand
+        self._scaled = {}           # (pyramid level, mode) -> downscaled image, built on demand
+        self._pool = None           # FrameBufferPool and index of the buffer, see attach()
+        self._index = None
+        self._lock = threading.RLock()  # Derived images are built into shared arrays
+
+    @property
+    def width(self):
+        return self.image.shape[1]
+
+    @property
+    def height(self):
+        return self.image.shape[0]
+
+    @property
+    def is_partial(self):
+        return self.regions is not None
+
+    def covers(self, x1, y1, x2, y2):
+        """Checks if a rectangle lies completely inside the captured area"""
+        if self.regions is None:
+            return True
+        return any(rx1 <= x1 and ry1 <= y1 and x2 <= rx2 and y2 <= ry2
+                   for rx1, ry1, rx2, ry2 in self.regions)
+
+    def pixels(self, mode='bgr'):
+        """Returns the frame in a match mode ('bgr', 'gray' or one channel), converted once"""
+        if mode == 'bgr':
+            return self.image
+        with self._lock:  # Matcher threads may ask for the same mode at once
+            converted = self._converted.get(mode)
+            if converted is None:
+                out = self._scratch(mode, self.image.shape[:2])
+                if self.regions is None:
+                    converted = convert_pixels(self.image, mode, out)
+                    if out is not None:
+                        self._pool.stale.forget(out)
+                else:
+                    # Only the captured rects hold pixels, convert just those
+                    if out is None:
+                        converted = np.zeros(self.image.shape[:2], dtype=self.image.dtype)
+                    else:
+                        converted = out
+                        self._pool.stale.prepare(converted, self.regions)
+                    for x1, y1, x2, y2 in self.regions:
+                        convert_pixels(self.image[y1:y2, x1:x2], mode, converted[y1:y2, x1:x2])
+                self._converted[mode] = converted
+            return converted
+
+    def scaled(self, level, mode='bgr'):
+        """Returns the frame downscaled by 2**level, computed once per frame"""
+        with self._lock:
+            scaled = self._scaled.get((level, mode))
+            if scaled is None:
+                factor = 1 << level
+                size = (max(1, self.width // factor), max(1, self.height // factor))
+                pixels = self.pixels(mode)
+                out = self._scratch((level, mode), (size[1], size[0]) + pixels.shape[2:])
+                scaled = cv2.resize(pixels, size, dst=out, interpolation=cv2.INTER_AREA)
+                self._scaled[(level, mode)] = scaled
+            return scaled
+
+    def _scratch(self, key, shape):
+        """Returns the pooled array of a derived image, or None without a pool"""
+        if self._pool is None:
+            return None
+        return self._pool.scratch(self._index, key, shape, self.image.dtype)
+
+    def pixel(self, x, y):
+        """Returns the RGB color at client position (x, y), like mss ScreenShot.pixel"""
+        b, g, r = self.image[y, x][:3]
+        return (int(r), int(g), int(b))
+
+
+class FrameBufferPool:
+    """Preallocated frame buffers that captures are converted into
+
+    A buffer is handed out again only once no Frame built on it is alive, so
+    a frame never changes while a tick still works on it. If every buffer is
+    still in use the pool grows by one. Each buffer also keeps the converted
+    and downscaled images of its frame, which are reused the same way.
+    """
+
+    def __init__(self, size=3):
+        self._buffers = [None] * size  # Preallocated BGR arrays
+        self._scratch = [{} for _ in range(size)]  # Per buffer: key -> derived image
+        self._owners = [None] * size   # Weak reference to the Frame of each buffer
+        self.stale = StaleRegions()    # Rects of the derived images holding old pixels
+        self.shape = None              # (shape, dtype) of the last capture
+        self.allocations = 0           # Buffers created, stays constant once warmed up
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Reserves a free buffer of the last capture's shape
+
+        Returns:
+            Tuple (index, array), or (None, None) before the first capture
+        """
+        if self.shape is None:
+            return None, None
+        shape, dtype = self.shape
+        with self._lock:
+            for index, owner in enumerate(self._owners):
+                if owner is None or owner() is None:
+                    break
+            else:
+                self._buffers.append(None)
+                self._scratch.append({})
+                self._owners.append(None)
+                index = len(self._buffers) - 1
+            buffer = self._buffers[index]
+            if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+                # First use or the window size changed
+                buffer = np.empty(shape, dtype=dtype)
+                self._buffers[index] = buffer
+                self.allocations += 1
+            self._owners[index] = _reserved_owner
+            return index, buffer
+
+    def attach(self, index, frame):
+        """Hands a reserved buffer over to the Frame built on it"""
+        with self._lock:
+            self._owners[index] = weakref.ref(frame)
+        frame._pool = self
+        frame._index = index
+
+    def scratch(self, index, key, shape, dtype):
+        """Returns the derived image array `key` of a buffer, allocated on first use"""
+        with self._lock:
+            array = self._scratch[index].get(key)
+            if array is None or array.shape != shape or array.dtype != dtype:
+                array = np.empty(shape, dtype=dtype)
+                self._scratch[index][key] = array
+                self.allocations += 1
+            return array
+
+    def release(self, index):
+        """Returns a reserved buffer that was not used"""
+        if index is not None:
+            with self._lock:
+                self._owners[index] = None
+
+    def __len__(self):
+        return len(self._buffers)
+
+
+class StaleRegions:
+    """Remembers which rects of reused arrays hold pixels of an earlier capture
+
+    A region capture into a reused array only has to clear the rects the
+    previous region capture filled, not the whole array. Arrays it does not
+    know (new, or last filled completely) are cleared completely once.
+    """
+
+    def __init__(self):
+        self._filled = {}  # id(array) -> (weak reference to the array, filled rects)
+        self._lock = threading.Lock()
+
+    def prepare(self, image, rects):
+        """Clears what an earlier capture left in an array before rects are filled"""
+        key = id(image)
+        rects = [tuple(rect) for rect in rects]
+        with self._lock:
+            previous = self._filled.get(key)
+            self._filled[key] = (weakref.ref(image, lambda _, key=key: self._drop(key)), list(rects))
+        if previous is None or previous[0]() is not image:
+            image.fill(0)
+            return
+        for x1, y1, x2, y2 in previous[1]:
+            if (x1, y1, x2, y2) not in rects:
+                image[y1:y2, x1:x2] = 0
+
+    def forget(self, image):
+        """Marks an array as completely overwritten"""
+        self._drop(id(image))
+
+    def _drop(self, key):
+        with self._lock:
+            self._filled.pop(key, None)
+
+
+def _reserved_owner():
+    """Owner of a buffer between acquire() and attach(), always alive"""
+    return True
+
+
+def capture_into(capture_func, pool):
+    """Runs a capture that may convert into a pool buffer
+
+    Args:
+        capture_func: Called as capture_func(out) with a free buffer (or None);
+                      returns (bgr_image, monitor[, regions]) or None
+        pool: FrameBufferPool providing the buffer
+
+    Returns:
+        Tuple (captured, index): index of the used buffer, None if the source
+        returned an array of its own (first capture, size change, replay)
+    """
+    index, buffer = pool.acquire()
+    try:
+        captured = capture_func(buffer)
+    except Exception:
+        pool.release(index)
+        raise
+    if captured is None or captured[0] is not buffer:
+        pool.release(index)
+        index = None
+    if captured is not None:
+        pool.shape = (captured[0].shape, captured[0].dtype)
+    return captured, index
+
+
+class CaptureWorker:
+    """Captures frames on its own thread so grabbing overlaps the decision work
+
+    Every capture is converted into a buffer of the shared FrameBufferPool and
+    published as the latest Frame; latest() never blocks.
+    """
+
+    def __init__(self, capture_func, fps, clock=None, id_func=None, pool=None, log=None):
+        """Creates the worker (call start() to run it)
+
+        Args:
+            capture_func: Called with an output buffer (or None), returns
+                          (bgr_image, monitor[, regions]) or None
+            fps: Captures per second
+            clock: Clock for the capture interval and the frame timestamps
+            id_func: Returns the next frame id, shared with synchronous captures
+            pool: FrameBufferPool shared with synchronous captures
+            log: Optional callable(message, level) for capture errors, printed without
+        """
+        self.capture_func = capture_func
+        self.fps = fps
+        self.clock = clock or SystemClock()
+        self.id_func = id_func
+        self.pool = pool or FrameBufferPool()
+        self.log = log or (lambda message, level: print(message))
+        self._latest = None
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.thread = None
+        self.running = False
+
+        # Statistics
+        self.captures = 0
+        self.capture_time = 0.0  # Seconds spent in capture_func
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='capture')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        self.thread = None
+        with self._lock:
+            self._latest = None
+
+    def latest(self):
+        """Returns the newest complete Frame, or None before the first capture"""
+        with self._lock:
+            return self._latest
+
+    def _take_id(self):
+        if self.id_func:
+            return self.id_func()
+        self._next_id += 1
+        return self._next_id - 1
+
+    def _capture(self, timestamp):
+        captured, index = capture_into(self.capture_func, self.pool)
+        if captured is None:
+            return
+        image, monitor = captured[:2]
+        regions = captured[2] if len(captured) > 2 else None
+        frame = Frame(image, monitor, self._take_id(), timestamp, regions)
+        if index is not None:
+            self.pool.attach(index, frame)
+        with self._lock:
+            self._latest = frame
+
+    def _run(self):
+        period = 1.0 / self.fps
+        while self.running:
+            # The timestamp is taken before the grab: the frame is at least that new
+            start = self.clock.time()
+            try:
+                self._capture(start)
+            except Exception as e:
+                self.log(f"Capture error: {e}", ERROR)
+            elapsed = self.clock.time() - start
+            self.captures += 1
+            self.capture_time += elapsed
+            self.clock.sleep(period - elapsed)
+
+
+class FrameSnapshot:
+    """Shares one capture per tick between all detectors
+
+    The bot loop calls refresh() once per tick; every template check in that
+    tick then reuses the same converted frame via get(). Code paths that do not
+    refresh themselves (wait loops, GUI tests) still get a fresh frame as soon
+    as the current one is older than max_age seconds.
+
+    With a running CaptureWorker, refresh() takes the worker's latest frame
+    instead of capturing. Only if that frame is older than the last
+    invalidate() (an input the screen reacts to) it captures directly.
+    Either way captures are converted into reused buffers of one pool.
+    """
+
+    def __init__(self, capture_func, max_age=0.25, clock=None, log=None):
+        self.capture_func = capture_func  # capture_func(out) -> (bgr_image, monitor[, regions]) or None
+        self.max_age = max_age
+        self.clock = clock or SystemClock()
+        self.log = log  # Passed on to the CaptureWorker
+        self.pool = FrameBufferPool()
+        self.worker = None
+        self.staleness = 0.0       # Age of the last refreshed frame when it was taken
+        self._frame = None
+        self._invalidated_at = None
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def start_worker(self, fps):
+        """Starts capturing on a background thread at fps frames per second"""
+        self.stop_worker()
+        self.worker = CaptureWorker(self.capture_func, fps, self.clock, self._take_id, self.pool, self.log)
+        self.worker.start()
+
+    def stop_worker(self):
+        """Stops the background capture, refresh() captures directly again"""
+        worker = self.worker
+        self.worker = None
+        if worker:
+            worker.stop()
+
+    def is_capture_thread(self):
+        """Checks if the caller is the background capture thread"""
+        worker = self.worker
+        return worker is not None and threading.current_thread() is worker.thread
+
+    def _take_id(self):
+        with self._lock:
+            frame_id = self._next_id
+            self._next_id += 1
+            return frame_id
+
+    def refresh(self, direct=False):
+        """Makes a new frame the current one (the worker's latest, or a new capture)
+
+        Args:
+            direct: Capture on the calling thread even if a worker runs
+        """
+        worker = None if direct else self.worker
+        if worker is not None:
+            frame = worker.latest()
+            with self._lock:
+                if frame is not None and (self._invalidated_at is None or
+                                          frame.timestamp >= self._invalidated_at):
+                    self._frame = frame
+                    self.staleness = self.clock.time() - frame.timestamp
+                    return frame
+            # Nothing captured yet, or only before the last input
+
+        captured, index = capture_into(self.capture_func, self.pool)
+        if captured is None:
+            with self._lock:
+                self._frame = None
+            return None
+        image, monitor = captured[:2]
+        regions = captured[2] if len(captured) > 2 else None
+        frame = Frame(image, monitor, self._take_id(), self.clock.time(), regions)
+        if index is not None:
+            self.pool.attach(index, frame)
+        with self._lock:
+            self._frame = frame
+            self.staleness = 0.0
+        return frame
+
+    def get(self):
+        """Returns the current frame, capturing a new one if missing or too old"""
+        with self._lock:
+            frame = self._frame
+        if frame is None or self.clock.time() - frame.timestamp > self.max_age:
+            frame = self.refresh()
+        return frame
+
+    def invalidate(self):
+        """Drops the current frame, e.g. after an input changed the screen"""
+        with self._lock:
+            self._frame = None
+            self._invalidated_at = self.clock.time()
+
+
+class FrameSource:
+    """Interface for everything that produces frames of the Temtem client area
+
+    grab() returns a tuple (bgr_image, monitor) or None when no frame is
+    available. monitor is an MSS style dict with left/top/width/height of the
+    captured area in screen coordinates. Sources that convert pixels anyway
+    write into `out` when it has the right shape and return it, so the hot
+    loop allocates no frame arrays; others may ignore it.
+    """
+
+    def is_ready(self):
+        """Returns True if grab() can currently deliver frames"""
+        return True
+
+    def grab(self, out=None):
+        raise NotImplementedError
+
+    def grab_regions(self, regions, out=None):
+        """Captures only some rectangles of the client area
+
+        Returns a tuple (bgr_image, monitor, regions) where bgr_image has the
+        full client size and only the given (x1, y1, x2, y2) rects are filled,
+        or None. Sources that cannot capture regions return a full frame.
+        """
+        return self.grab(out)
+
+    def close(self):
+        """Releases capture resources"""
+        pass
+
+
+class MSSFrameSource(FrameSource):
+    """Live capture of the game window with MSS"""
+
+    def __init__(self, monitor_func, ready_func=None):
+        self.monitor_func = monitor_func  # Returns the monitor dict of the window or None
+        self.ready_func = ready_func
+        self._thread_local = threading.local()  # MSS instances are not thread safe
+        self._instances = []  # Every MSS instance created, on any thread
+        self._instances_lock = threading.Lock()
+        self._stale = StaleRegions()  # Rects of reused buffers filled by region captures
+
+    def _ensure_mss(self):
+        """Ensures MSS is initialized in the current thread"""
+        if not hasattr(self._thread_local, 'sct'):
+            sct = mss.mss()
+            with self._instances_lock:
+                self._instances.append(sct)
+            self._thread_local.sct = sct
+        return self._thread_local.sct
+
+    def is_ready(self):
+        if self.ready_func:
+            return bool(self.ready_func())
+        return True
+
+    def _grab_bgra(self, monitor):
+        """Grabs a screen area as a BGRA view of the MSS buffer (no copy)"""
+        screenshot = self._ensure_mss().grab(monitor)
+        return np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+
+    def grab_area(self, monitor, out=None):
+        """Captures an arbitrary screen area and returns it as BGR array
+
+        Args:
+            out: Optional preallocated BGR array of the area's size, converted into
+        """
+        bgra = self._grab_bgra(monitor)
+        if out is not None and out.shape == bgra.shape[:2] + (3,) and out.dtype == np.uint8:
+            return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=out)
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR)
+
+    def screen_area(self):
+        """Returns the monitor dict covering all screens"""
+        return dict(self._ensure_mss().monitors[0])
+
+    def grab(self, out=None):
+        monitor = self.monitor_func()
+        if not monitor:
+            return None
+        image = self.grab_area(monitor, out)
+        self._stale.forget(image)
+        return image, monitor
+
+    def grab_regions(self, regions, out=None):
+        monitor = self.monitor_func()
+        if not monitor:
+            return None
+        shape = (monitor["height"], monitor["width"], 3)
+        captured = []
+        for x1, y1, x2, y2 in regions:
+            x2 = min(x2, monitor["width"])
+            y2 = min(y2, monitor["height"])
+            if x2 > x1 and y2 > y1:
+                captured.append((x1, y1, x2, y2))
+        if out is not None and out.shape == shape and out.dtype == np.uint8:
+            # Reused buffer: clear only what earlier frames left outside the rects
+            image = out
+            self._stale.prepare(image, captured)
+        else:
+            # np.zeros maps zeroed pages lazily, so untouched areas cost nothing
+            image = np.zeros(shape, dtype=np.uint8)
+        for x1, y1, x2, y2 in captured:
+            area = {"left": monitor["left"] + x1, "top": monitor["top"] + y1,
+                    "width": x2 - x1, "height": y2 - y1}
+            # Drop the alpha channel while copying into the frame buffer
+            image[y1:y2, x1:x2] = self._grab_bgra(area)[:, :, :3]
+        return image, monitor, captured
+
+    def close(self):
+        """Closes the MSS instances of all threads (capture worker and bot thread included)"""
+        with self._instances_lock:
+            instances = self._instances
+            self._instances = []
+            # A thread grabbing again afterwards creates a new instance
+            self._thread_local = threading.local()
+        for sct in instances:
+            sct.close()
+
+
+def _client_monitor(image):
+    """Monitor dict for a recorded frame (client area at the screen origin)"""
+    return {"top": 0, "left": 0, "width": image.shape[1], "height": image.shape[0]}
+
+
+class ImageDirectoryFrameSource(FrameSource):
+    """Replays a directory of PNG/JPG screenshots in file name order"""
+
+    def __init__(self, directory, loop=False):
+        self.directory = directory
+        self.loop = loop
+        self.files = sorted(
+            os.path.join(directory, f) for f in os.listdir(directory)
+            if f.lower().endswith(('.png', '.jpg', '.jpeg'))
+        )
+        self.index = 0
+
+    def __len__(self):
+        return len(self.files)
+
+    def is_ready(self):
+        return self.index < len(self.files) or (self.loop and bool(self.files))
+
+    def grab(self, out=None):
+        if not self.is_ready():
+            return None
+        if self.index >= len(self.files):
+            self.index = 0
+        image = cv2.imread(self.files[self.index], cv2.IMREAD_COLOR)
+        self.index += 1
+        if image is None:
+            return None
+        return image, _client_monitor(image)
+
+
+class ReplayFrameSource(FrameSource):
+    """Replays a recorded session from a numpy .npz archive or a video file
+
+    An .npz archive either holds one 'frames' array of shape (N, H, W, 3) or
+    one BGR array per frame, replayed in sorted key order. Anything else is
+    opened with cv2.VideoCapture.
+    """
+
+    def __init__(self, path, loop=False):
+        self.path = path
+        self.loop = loop
+        self.index = 0
+        self._frames = None
+        self._video = None
+        if path.lower().endswith('.npz'):
+            with np.load(path) as data:
+                if 'frames' in data.files:
+                    self._frames = list(data['frames'])
+                else:
+                    self._frames = [data[key] for key in sorted(data.files)]
+        else:
+            self._video = cv2.VideoCapture(path)
+            if not self._video.isOpened():
+                raise ValueError(f"Could not open video {path}")
+
+    def is_ready(self):
+        if self._frames is not None:
+            return self.index < len(self._frames) or (self.loop and bool(self._frames))
+        return self._video is not None
+
+    def _next_image(self):
+        if self._frames is not None:
+            if self.index >= len(self._frames):
+                if not self.loop:
+                    return None
+                self.index = 0
+            image = self._frames[self.index]
+            self.index += 1
+            return image
+
+        ok, image = self._video.read()
+        if not ok and self.loop:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, image = self._video.read()
+        if not ok:
+            self._video.release()
+            self._video = None
+            return None
+        self.index += 1
+        return image
+
+    def grab(self, out=None):
+        if not self.is_ready():
+            return None
+        image = self._next_image()
+        if image is None:
+            return None
+        return np.ascontiguousarray(image[:, :, :3]), _client_monitor(image)
+
+    def close(self):
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+
+
+def open_frame_source(path, loop=False):
+    """Opens a recorded session: a directory of screenshots, an .npz archive or a video"""
+    if os.path.isdir(path):
+        return ImageDirectoryFrameSource(path, loop=loop)
+    return ReplayFrameSource(path, loop=loop)
@@ -0,0 +1,427 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import threading
+import time
+import numpy as np
+import cv2
+from PIL import Image
+from autolevel import AutoLeveler
+from clock import SystemClock, ScaledClock, VirtualClock
+from config_manager import MemoryConfigManager
+from frame_capture import FrameSource, StaleRegions
+from input_backend import InputBackend, RecordingInputBackend, save_recording
+from window_backend import FakeWindowBackend
+
+# Client size the templates were made for
+SCREEN_WIDTH = 1360
+SCREEN_HEIGHT = 768
+
+# Pixel the bot probes for the end of a battle (95% width, 5% height), BGR
+BATTLE_END_PIXEL = (int(SCREEN_WIDTH * 0.95), int(SCREEN_HEIGHT * 0.05))
+BATTLE_END_COLOR = (234, 232, 60)
+
+# Where each template is pasted on its screen (client coordinates)
+TEMPLATE_POSITIONS = {
+    'map': (1320, 12),
+    'run': (1250, 690),
+    'bag': (1190, 690),
+    'kill': (632, 600),
+    'chose': (606, 420),
+    'overload': (635, 400),
+    'died1': (526, 330),
+}
+
+# Templates visible on each simulated screen
+SCREEN_TEMPLATES = {
+    'map': ['map'],
+    'loading': [],
+    'battle_menu': ['run', 'bag'],
+    'animation': [],
+    'kill': ['kill'],
+    'chose': ['chose'],
+    'overload': ['overload'],
+    'died': ['died1'],
+}
+
+# Key that resolves a screen waiting for input
+EXPECTED_KEYS = {
+    'kill': 'f',
+    'chose': 'f',
+    'overload': '6',
+    'died': 'f',
+}
+
+MOVEMENT_KEYS = ('a', 'd', 'w', 's')
+
+
+def load_template_groups(img_dir):
+    """Loads the templates from img_dir grouped by type, like the GUI does"""
+    groups = {}
+    for filename in sorted(os.listdir(img_dir)):
+        if not filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        base_name = os.path.splitext(filename.lower())[0]
+        template_type = ''.join(c for c in base_name if not c.isdigit()).rstrip('_')
+        image = Image.open(os.path.join(img_dir, filename)).convert('RGB')
+        groups.setdefault(template_type, []).append({'name': filename, 'image': image})
+    return groups
+
+
+class GameSimulator(FrameSource):
+    """Headless stand-in for the Temtem client
+
+    Serves synthetic 1360x768 frames built from the real templates and walks a
+    scripted encounter/battle state graph that reacts to the keys the bot sends.
+    """
+
+    def __init__(self, img_dir=None, seed=None, clock=None, encounter_time=(2.0, 6.0), loading_time=1.5,
+                 animation_time=2.5, hits_to_kill=(1, 3), chose_chance=0.3,
+                 overload_chance=0.05, death_chance=0.02):
+        self.clock = clock or SystemClock()
+        self.img_dir = img_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'img')
+        self.random = random.Random(seed)
+        self.encounter_time = encounter_time
+        self.loading_time = loading_time
+        self.animation_time = animation_time
+        self.hits_to_kill = hits_to_kill
+        self.chose_chance = chose_chance
+        self.overload_chance = overload_chance
+        self.death_chance = death_chance
+        self._lock = threading.Lock()
+        self._stale = StaleRegions()  # Rects of reused buffers filled by region captures
+        self.screens = self._render_screens()
+        self.reset()
+
+    def _render_screens(self):
+        """Pre-renders one frame per screen on a textured background"""
+        templates = {}
+        for filename in os.listdir(self.img_dir):
+            name = os.path.splitext(filename.lower())[0]
+            if name in TEMPLATE_POSITIONS:
+                image = Image.open(os.path.join(self.img_dir, filename)).convert('RGB')
+                templates[name] = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+        # Smooth gradient with noise, so templates do not match a flat background
+        rng = np.random.default_rng(0)
+        xs = np.linspace(40, 120, SCREEN_WIDTH, dtype=np.float32)
+        ys = np.linspace(0, 60, SCREEN_HEIGHT, dtype=np.float32)[:, None]
+        base = (xs[None, :] + ys)[:, :, None] * np.array([1.0, 0.8, 0.6], dtype=np.float32)
+        noise = rng.normal(0, 12, (SCREEN_HEIGHT, SCREEN_WIDTH, 3))
+        background = np.clip(base + noise, 0, 255).astype(np.uint8)
+
+        screens = {}
+        for screen, names in SCREEN_TEMPLATES.items():
+            frame = background.copy()
+            for name in names:
+                template = templates.get(name)
+                if template is None:
+                    continue
+                x, y = TEMPLATE_POSITIONS[name]
+                h, w = template.shape[:2]
+                frame[y:y + h, x:x + w] = template
+            if screen == 'map':
+                px, py = BATTLE_END_PIXEL
+                frame[py, px] = BATTLE_END_COLOR
+            screens[screen] = frame
+        return screens
+
+    def reset(self):
+        """Starts a new session on the map"""
+        with self._lock:
+            self.state = 'map'
+            self.state_since = self.clock.time()
+            self.held_keys = set()
+            self.walked = 0.0
+            self.last_walk_update = self.clock.time()
+            self.next_encounter = self.random.uniform(*self.encounter_time)
+            self.hits_left = 0
+            self.selected_attack = None
+            self.battles = 0
+            self.deaths = 0
+            self.frames_served = 0
+            self.wrong_inputs = 0
+            self.latencies = []
+            self.pending_since = None
+
+    # State graph
+
+    def _enter(self, state):
+        now = self.clock.time()
+        self.state = state
+        self.state_since = now
+        # Screens that wait for the bot start a decision latency measurement
+        self.pending_since = now if state in EXPECTED_KEYS or state == 'battle_menu' else None
+
+    def _resolve(self):
+        """Records the decision latency of the pending screen"""
+        if self.pending_since is not None:
+            self.latencies.append(self.clock.time() - self.pending_since)
+            self.pending_since = None
+
+    def _advance(self):
+        """Applies the timed transitions up to now"""
+        now = self.clock.time()
+        if self.state == 'map':
+            if self.held_keys & set(MOVEMENT_KEYS):
+                self.walked += now - self.last_walk_update
+            self.last_walk_update = now
+            if self.walked >= self.next_encounter:
+                self.walked = 0.0
+                self.next_encounter = self.random.uniform(*self.encounter_time)
+                self.hits_left = self.random.randint(*self.hits_to_kill)
+                self._enter('loading')
+        elif self.state == 'loading' and now - self.state_since >= self.loading_time:
+            self._enter('battle_menu' if self.hits_left > 0 else 'map')
+        elif self.state == 'animation' and now - self.state_since >= self.animation_time:
+            if self.random.random() < self.death_chance:
+                self.deaths += 1
+                self._enter('died')
+            elif self.hits_left <= 0:
+                self._enter('kill')
+            elif self.random.random() < self.overload_chance:
+                self._enter('overload')
+            else:
+                self._enter('battle_menu')
+
+    def _finish_battle(self):
+        self.battles += 1
+        self.hits_left = 0
+        self.last_walk_update = self.clock.time()
+        self._enter('loading')
+
+    def on_key(self, key, hold=False, release=False):
+        """Feeds one key event from the bot into the state graph"""
+        with self._lock:
+            self._advance()
+            if release:
+                self.held_keys.discard(key)
+                return
+            if hold:
+                self.held_keys.add(key)
+                return
+            # Single key press
+            expected = EXPECTED_KEYS.get(self.state)
+            if self.state == 'battle_menu' and key in ('1', '2'):
+                self.selected_attack = key
+                self._resolve()
+            elif self.state == 'battle_menu' and key == 'f' and self.selected_attack:
+                self.selected_attack = None
+                self.hits_left -= 1
+                self._enter('animation')
+            elif expected == key:
+                self._resolve()
+                if self.state == 'kill':
+                    if self.random.random() < self.chose_chance:
+                        self._enter('chose')
+                    else:
+                        self._finish_battle()
+                elif self.state == 'chose':
+                    self._finish_battle()
+                elif self.state == 'overload':
+                    self._enter('battle_menu')
+                elif self.state == 'died':
+                    self.hits_left = 0
+                    self.last_walk_update = self.clock.time()
+                    self._enter('loading')
+            elif self.state == 'died' and key == 'w':
+                pass  # Part of the revive sequence
+            else:
+                self.wrong_inputs += 1
+
+    def on_mouse_click(self, right_click=False):
+        """Right click clears a stuck chose dialog like in the game"""
+        with self._lock:
+            self._advance()
+            if right_click and self.state == 'chose':
+                self._resolve()
+                self._finish_battle()
+
+    # FrameSource
+
+    def grab(self, out=None):
+        with self._lock:
+            self._advance()
+            self.frames_served += 1
+            image = self.screens[self.state]
+        if out is not None and out.shape == image.shape and out.dtype == image.dtype:
+            # Copied like a live capture, so the frame uses the pooled buffers too
+            np.copyto(out, image)
+            self._stale.forget(out)
+            image = out
+        return image, {"top": 0, "left": 0, "width": SCREEN_WIDTH, "height": SCREEN_HEIGHT}
+
+    def grab_regions(self, regions, out=None):
+        """Region capture like MSSFrameSource: only the rects are copied"""
+        grabbed = self.grab()
+        if grabbed is None:
+            return None
+        screen, monitor = grabbed
+        if out is not None and out.shape == screen.shape and out.dtype == screen.dtype:
+            image = out
+            self._stale.prepare(image, regions)
+        else:
+            image = np.zeros_like(screen)
+        for x1, y1, x2, y2 in regions:
+            image[y1:y2, x1:x2] = screen[y1:y2, x1:x2]
+        return image, monitor, list(regions)
+
+
+class SimulatorInputBackend(InputBackend):
+    """InputBackend feeding the key and mouse events into a GameSimulator"""
+
+    name = 'simulator'
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+
+    def key_down(self, key):
+        self.simulator.on_key(key, hold=True)
+
+    def key_up(self, key):
+        self.simulator.on_key(key, release=True)
+
+    def press(self, key):
+        self.simulator.on_key(key)
+
+    def move_mouse(self, x, y):
+        pass
+
+    def mouse_down(self, x, y, right=False):
+        pass
+
+    def mouse_up(self, x, y, right=False):
+        self.simulator.on_mouse_click(right_click=right)
+
+
+class SimulatedAutoLeveler(AutoLeveler):
+    """AutoLeveler playing a GameSimulator instead of the game window
+
+    The game window is a fake desktop window of the simulator size and the
+    inputs go through the normal input path (focus cycle included) into a
+    RecordingInputBackend that passes them on to the simulator, so every
+    event is available in `input_backend.events` afterwards.
+    """
+
+    def __init__(self, simulator):
+        window_backend = FakeWindowBackend(windows={1: (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)},
+                                           clock=simulator.clock)
+        input_backend = RecordingInputBackend(clock=simulator.clock, target=SimulatorInputBackend(simulator))
+        # Default settings in memory: reproducible, and the user's config.json stays untouched
+        super().__init__(clock=simulator.clock, window_backend=window_backend, input_backend=input_backend,
+                         config=MemoryConfigManager())
+        self.simulator = simulator
+        self.window_handle = 1
+        # Regions learned on the simulator screens must not reach the user's profile
+        self.persist_regions = False
+        # Threads sleeping on a virtual clock would advance the game time
+        self.async_capture = not isinstance(simulator.clock, VirtualClock)
+        self.async_input = self.async_capture
+        self.set_frame_source(simulator)
+
+
+def make_clock(speed):
+    """Clock for a simulation speed: 0 = instant virtual time, 1 = real time"""
+    if speed == 0:
+        return VirtualClock()
+    if speed == 1:
+        return SystemClock()
+    return ScaledClock(speed)
+
+
+def run_simulation(duration=60.0, seed=None, speed=0, bot_factory=SimulatedAutoLeveler, input_log=None,
+                   **simulator_options):
+    """Runs the bot against the simulator and returns the measured statistics
+
+    Args:
+        duration: Session length in (simulated) seconds
+        seed: Random seed for a reproducible encounter script
+        speed: Time acceleration, 0 runs in instant virtual time
+        bot_factory: Callable that builds the bot for a simulator, so different
+                     capture or matching setups can be compared
+        input_log: Optional JSONL file for the recorded input events
+        simulator_options: Passed on to GameSimulator
+    """
+    clock = make_clock(speed)
+    simulator = GameSimulator(seed=seed, clock=clock, **simulator_options)
+
+    # The bot prints every decision - keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        bot = bot_factory(simulator)
+        bot.highlight_enabled = False
+        bot.set_templates(load_template_groups(simulator.img_dir))
+
+        start_time = clock.time()
+        start_real = time.time()
+        start_cpu = time.process_time()
+        bot.start()
+        try:
+            # Watch the session clock from outside, the bot thread drives it
+            while bot.thread.is_alive() and clock.time() - start_time < duration:
+                time.sleep(0.01)
+        finally:
+            bot.stop()
+        elapsed = clock.time() - start_time
+        real = time.time() - start_real
+        cpu = time.process_time() - start_cpu
+
+    # Events of the recording input backend, if the bot has one
+    events = getattr(bot.input_backend, 'events', [])
+    if input_log:
+        save_recording(events, input_log)
+
+    latencies = sorted(simulator.latencies)
+    battles = simulator.battles
+    return {
+        'duration': elapsed,
+        'real_time': real,
+        'battles': battles,
+        'battles_per_hour': battles * 3600.0 / elapsed if elapsed > 0 else 0.0,
+        'deaths': simulator.deaths,
+        'decisions': len(latencies),
+        'latency_mean': sum(latencies) / len(latencies) if latencies else 0.0,
+        'latency_p95': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        'cpu_time': cpu,
+        'cpu_per_battle': cpu / battles if battles else 0.0,
+        'frames': simulator.frames_served,
+        'wrong_inputs': simulator.wrong_inputs,
+        'log_entries': bot.logger.emitted,
+        'log_folded': bot.logger.folded,
+        'log_suppressed': bot.logger.suppressed,
+        'input_events': getattr(bot.input_backend, 'recorded', len(events)),
+        'focus_cycles': bot.input.bursts,
+    }
+
+
+def format_report(stats):
+    """Formats the statistics of run_simulation for the console"""
+    return "\n".join([
+        f"Session:          {stats['duration']:.1f} s simulated in {stats['real_time']:.1f} s",
+        f"Battles:          {stats['battles']} ({stats['battles_per_hour']:.1f} battles/hour)",
+        f"Deaths:           {stats['deaths']}",
+        f"Decision latency: mean {stats['latency_mean'] * 1000:.0f} ms, "
+        f"p95 {stats['latency_p95'] * 1000:.0f} ms ({stats['decisions']} decisions)",
+        f"CPU:              {stats['cpu_time']:.2f} s total, {stats['cpu_per_battle']:.2f} s per battle",
+        f"Frames served:    {stats['frames']}",
+        f"Wrong inputs:     {stats['wrong_inputs']}",
+        f"Log entries:      {stats['log_entries']} ({stats['log_folded']} repeats folded, "
+        f"{stats['log_suppressed']} over the rate limit)",
+        f"Input events:     {stats['input_events']} in {stats['focus_cycles']} focus cycles",
+    ])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs the bot against a headless Temtem simulator")
+    parser.add_argument('--duration', type=float, default=60.0, help="Session length in seconds")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed for the encounter script")
+    parser.add_argument('--speed', type=float, default=0,
+                        help="Time acceleration (0 = instant virtual time, 1 = real time)")
+    parser.add_argument('--input-log', default=None,
+                        help="JSONL file to write the input events of the session to "
+                             "(the newest ones of very long sessions)")
+    args = parser.parse_args()
+
+    print(format_report(run_simulation(duration=args.duration, seed=args.seed, speed=args.speed,
+                                       input_log=args.input_log)))
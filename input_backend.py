@@ -0,0 +1,397 @@
+import ctypes
+import json
+import os
+import sys
+import threading
+from collections import deque
+from clock import SystemClock
+
+# X11 events through the XTEST extension (python-xlib, also used by pyautogui there)
+try:
+    from Xlib import X, XK, display as xdisplay
+    from Xlib.ext import xtest
+    HAS_XLIB = True
+except ImportError:
+    HAS_XLIB = False
+
+# SendInput needs user32, i.e. Windows
+HAS_SENDINPUT = sys.platform == 'win32'
+
+# Events a RecordingInputBackend keeps, the oldest are dropped
+DEFAULT_MAX_EVENTS = 50000
+
+
+class InputBackend:
+    """Interface for key and mouse events
+
+    The events go to whatever window has the focus, focusing the game window
+    is the job of the WindowBackend (see input_dispatcher.py). Keys are
+    pyautogui style names ('a', '6', 'shift', 'enter', ...), mouse positions
+    are screen coordinates.
+    """
+
+    name = 'base'
+
+    def key_down(self, key):
+        raise NotImplementedError
+
+    def key_up(self, key):
+        raise NotImplementedError
+
+    def press(self, key):
+        """Presses and releases a key"""
+        self.key_down(key)
+        self.key_up(key)
+
+    def move_mouse(self, x, y):
+        """Moves the cursor to screen position (x, y)"""
+        raise NotImplementedError
+
+    def mouse_down(self, x, y, right=False):
+        raise NotImplementedError
+
+    def mouse_up(self, x, y, right=False):
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the resources of the backend"""
+        pass
+
+
+class PyAutoGUIInputBackend(InputBackend):
+    """Events through pyautogui, the bot's original input path"""
+
+    name = 'pyautogui'
+
+    def __init__(self, pause=0.05):
+        """Creates the backend
+
+        Args:
+            pause: Seconds pyautogui waits after every call (pyautogui.PAUSE)
+        """
+        # Imported here, pyautogui needs a display already on import
+        import pyautogui
+        pyautogui.FAILSAFE = False
+        pyautogui.PAUSE = pause
+        self._pyautogui = pyautogui
+
+    def key_down(self, key):
+        self._pyautogui.keyDown(key)
+
+    def key_up(self, key):
+        self._pyautogui.keyUp(key)
+
+    def press(self, key):
+        self._pyautogui.press(key)
+
+    def move_mouse(self, x, y):
+        self._pyautogui.moveTo(x, y)
+
+    def mouse_down(self, x, y, right=False):
+        self._pyautogui.mouseDown(x, y, button='right' if right else 'left')
+
+    def mouse_up(self, x, y, right=False):
+        self._pyautogui.mouseUp(x, y, button='right' if right else 'left')
+
+
+# SendInput constants and structures (winuser.h)
+INPUT_MOUSE = 0
+INPUT_KEYBOARD = 1
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_SCANCODE = 0x0008
+MOUSEEVENTF_LEFTDOWN = 0x0002
+MOUSEEVENTF_LEFTUP = 0x0004
+MOUSEEVENTF_RIGHTDOWN = 0x0008
+MOUSEEVENTF_RIGHTUP = 0x0010
+MAPVK_VK_TO_VSC = 0
+
+# Virtual key codes of the named keys, single characters use VkKeyScanW
+VIRTUAL_KEYS = {
+    'backspace': 0x08, 'tab': 0x09, 'enter': 0x0D, 'shift': 0x10, 'ctrl': 0x11,
+    'alt': 0x12, 'esc': 0x1B, 'space': 0x20, 'left': 0x25, 'up': 0x26,
+    'right': 0x27, 'down': 0x28,
+}
+
+if HAS_SENDINPUT:
+    from ctypes import wintypes
+
+    class MOUSEINPUT(ctypes.Structure):
+        _fields_ = (("dx", wintypes.LONG),
+                    ("dy", wintypes.LONG),
+                    ("mouseData", wintypes.DWORD),
+                    ("dwFlags", wintypes.DWORD),
+                    ("time", wintypes.DWORD),
+                    ("dwExtraInfo", ctypes.POINTER(wintypes.ULONG)))
+
+    class KEYBDINPUT(ctypes.Structure):
+        _fields_ = (("wVk", wintypes.WORD),
+                    ("wScan", wintypes.WORD),
+                    ("dwFlags", wintypes.DWORD),
+                    ("time", wintypes.DWORD),
+                    ("dwExtraInfo", ctypes.POINTER(wintypes.ULONG)))
+
+    class HARDWAREINPUT(ctypes.Structure):
+        _fields_ = (("uMsg", wintypes.DWORD),
+                    ("wParamL", wintypes.WORD),
+                    ("wParamH", wintypes.WORD))
+
+    class INPUT(ctypes.Structure):
+        class _INPUT(ctypes.Union):
+            _fields_ = (("ki", KEYBDINPUT),
+                        ("mi", MOUSEINPUT),
+                        ("hi", HARDWAREINPUT))
+        _anonymous_ = ("_input",)
+        _fields_ = (("type", wintypes.DWORD),
+                    ("_input", _INPUT))
+
+
+class SendInputBackend(InputBackend):
+    """Events through the Win32 SendInput call (ctypes, no pyautogui)
+
+    Keys are sent as hardware scan codes, which games reading raw keyboard
+    input accept as well. There is no pause after the events, so this is the
+    cheapest backend per event.
+    """
+
+    name = 'sendinput'
+
+    def __init__(self):
+        if not HAS_SENDINPUT:
+            raise RuntimeError("SendInput is only available on Windows")
+        self._user32 = ctypes.WinDLL('user32', use_last_error=True)
+        self._scan_codes = {}
+
+    def _scan_code(self, key):
+        code = self._scan_codes.get(key)
+        if code is None:
+            vk = VIRTUAL_KEYS.get(key.lower())
+            if vk is None:
+                if len(key) != 1:
+                    raise ValueError(f"Unknown key: {key}")
+                vk = self._user32.VkKeyScanW(ord(key)) & 0xFF
+            code = self._user32.MapVirtualKeyW(vk, MAPVK_VK_TO_VSC)
+            self._scan_codes[key] = code
+        return code
+
+    def _send(self, event):
+        if self._user32.SendInput(1, ctypes.byref(event), ctypes.sizeof(INPUT)) != 1:
+            raise ctypes.WinError(ctypes.get_last_error())
+
+    def _key(self, key, flags):
+        event = INPUT(type=INPUT_KEYBOARD)
+        event.ki = KEYBDINPUT(0, self._scan_code(key), KEYEVENTF_SCANCODE | flags, 0, None)
+        self._send(event)
+
+    def _button(self, flags):
+        event = INPUT(type=INPUT_MOUSE)
+        event.mi = MOUSEINPUT(0, 0, 0, flags, 0, None)
+        self._send(event)
+
+    def key_down(self, key):
+        self._key(key, 0)
+
+    def key_up(self, key):
+        self._key(key, KEYEVENTF_KEYUP)
+
+    def move_mouse(self, x, y):
+        self._user32.SetCursorPos(int(x), int(y))
+
+    def mouse_down(self, x, y, right=False):
+        self._button(MOUSEEVENTF_RIGHTDOWN if right else MOUSEEVENTF_LEFTDOWN)
+
+    def mouse_up(self, x, y, right=False):
+        self._button(MOUSEEVENTF_RIGHTUP if right else MOUSEEVENTF_LEFTUP)
+
+
+class XTestInputBackend(InputBackend):
+    """Events on an X11 desktop through the XTEST extension"""
+
+    name = 'xtest'
+
+    def __init__(self, display_name=None):
+        if not HAS_XLIB:
+            raise RuntimeError("python-xlib is not installed")
+        self._display = xdisplay.Display(display_name)
+        self._lock = threading.Lock()  # One Xlib connection, used from several threads
+
+    def _keycode(self, key):
+        keysym = XK.string_to_keysym(key)
+        if keysym == 0 and len(key) == 1:
+            keysym = ord(key)
+        return self._display.keysym_to_keycode(keysym)
+
+    def _fake(self, event, detail=0, **position):
+        with self._lock:
+            xtest.fake_input(self._display, event, detail, **position)
+            self._display.sync()
+
+    def key_down(self, key):
+        self._fake(X.KeyPress, self._keycode(key))
+
+    def key_up(self, key):
+        self._fake(X.KeyRelease, self._keycode(key))
+
+    def move_mouse(self, x, y):
+        self._fake(X.MotionNotify, x=x, y=y)
+
+    def mouse_down(self, x, y, right=False):
+        self._fake(X.ButtonPress, 3 if right else 1)
+
+    def mouse_up(self, x, y, right=False):
+        self._fake(X.ButtonRelease, 3 if right else 1)
+
+    def close(self):
+        self._display.close()
+
+
+class RecordingInputBackend(InputBackend):
+    """Records every event with a timestamp, optionally passing it on
+
+    Events are dictionaries like {"time": 12.5, "event": "key_down", "key": "a"}
+    or {"time": 13.0, "event": "mouse_down", "x": 680, "y": 400, "right": false},
+    kept in `events` and, with a path, appended to a JSONL file (one event per
+    line). Only the newest max_events are kept in memory, the file gets all.
+    Without a target nothing reaches the desktop, so action sequences and
+    input timing can be checked on any platform.
+    """
+
+    name = 'recording'
+
+    def __init__(self, clock=None, path=None, target=None, keep=True, max_events=DEFAULT_MAX_EVENTS):
+        """Creates the backend
+
+        Args:
+            clock: Clock for the timestamps
+            path: Optional JSONL file the events are appended to
+            target: Optional InputBackend that receives every event as well
+            keep: Keep the events in memory (`events`)
+            max_events: Maximum events kept in memory, the oldest are dropped
+        """
+        self.clock = clock or SystemClock()
+        self.target = target
+        self.keep = keep
+        self.events = deque(maxlen=max_events)
+        self.recorded = 0  # Events recorded, including the dropped ones
+        self.held_keys = set()
+        self.cursor = (0, 0)
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+        self._lock = threading.Lock()
+
+    def _record(self, event, **data):
+        entry = {"time": self.clock.time(), "event": event}
+        entry.update(data)
+        with self._lock:
+            self.recorded += 1
+            if self.keep:
+                self.events.append(entry)
+            if self._file:
+                self._file.write(json.dumps(entry) + "\n")
+                self._file.flush()
+
+    def events_of(self, event):
+        """Returns the recorded events of one kind, e.g. 'key_down'"""
+        return [entry for entry in self.events if entry["event"] == event]
+
+    def key_down(self, key):
+        self._record('key_down', key=key)
+        self.held_keys.add(key)
+        if self.target:
+            self.target.key_down(key)
+
+    def key_up(self, key):
+        self._record('key_up', key=key)
+        self.held_keys.discard(key)
+        if self.target:
+            self.target.key_up(key)
+
+    def press(self, key):
+        self._record('press', key=key)
+        if self.target:
+            self.target.press(key)
+
+    def move_mouse(self, x, y):
+        self._record('move_mouse', x=x, y=y)
+        self.cursor = (x, y)
+        if self.target:
+            self.target.move_mouse(x, y)
+
+    def mouse_down(self, x, y, right=False):
+        self._record('mouse_down', x=x, y=y, right=right)
+        if self.target:
+            self.target.mouse_down(x, y, right=right)
+
+    def mouse_up(self, x, y, right=False):
+        self._record('mouse_up', x=x, y=y, right=right)
+        if self.target:
+            self.target.mouse_up(x, y, right=right)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+        if self.target:
+            self.target.close()
+
+
+def load_recording(path):
+    """Reads the events of a RecordingInputBackend JSONL file"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_recording(events, path):
+    """Writes recorded events to a JSONL file, one event per line"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in events:
+            f.write(json.dumps(entry) + "\n")
+
+
+def replay_recording(events, backend, clock=None, speed=1.0):
+    """Sends recorded events to a backend with their original spacing
+
+    Args:
+        events: Events as recorded (see RecordingInputBackend)
+        backend: InputBackend receiving the events
+        clock: Clock for the waits between events
+        speed: Replay speed, 2.0 halves the waits, 0 sends without waiting
+    """
+    clock = clock or SystemClock()
+    previous = None
+    for entry in events:
+        if previous is not None and speed > 0:
+            clock.sleep(max(0.0, (entry["time"] - previous) / speed))
+        previous = entry["time"]
+
+        event = entry["event"]
+        if event in ('key_down', 'key_up', 'press'):
+            getattr(backend, event)(entry["key"])
+        elif event == 'move_mouse':
+            backend.move_mouse(entry["x"], entry["y"])
+        elif event in ('mouse_down', 'mouse_up'):
+            getattr(backend, event)(entry["x"], entry["y"], right=entry.get("right", False))
+
+
+# Backends by name, e.g. for the input cost benchmark
+INPUT_BACKENDS = {
+    'pyautogui': PyAutoGUIInputBackend,
+    'sendinput': SendInputBackend,
+    'xtest': XTestInputBackend,
+    'recording': RecordingInputBackend,
+}
+
+
+def default_input_backend():
+    """Returns the input backend of the running desktop
+
+    pyautogui on Windows (the bot's original input path), XTEST if an X
+    display is available, else a recording backend (events go nowhere).
+    """
+    if sys.platform == 'win32':
+        return PyAutoGUIInputBackend()
+    if HAS_XLIB and os.environ.get('DISPLAY'):
+        try:
+            return XTestInputBackend()
+        except Exception as e:
+            print(f"Could not open the X display: {e}")
+    return RecordingInputBackend()
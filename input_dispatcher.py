@@ -0,0 +1,270 @@
+import queue
+import threading
+from bot_logging import ERROR
+from clock import SystemClock
+
+# Seconds the dispatcher waits for further actions before sending a burst
+DEFAULT_GROUP_WINDOW = 0.01
+
+# Seconds between focusing the game window and the first event
+DEFAULT_FOCUS_DELAY = 0.03
+
+
+class InputAction:
+    """One key or mouse action for the game window"""
+
+    __slots__ = ('kind', 'key', 'hold', 'release', 'x', 'y', 'right', 'delay')
+
+    def __init__(self, kind, key=None, hold=False, release=False, x=0, y=0, right=False, delay=0.0):
+        self.kind = kind        # 'key' or 'click'
+        self.key = key
+        self.hold = hold        # Key down only
+        self.release = release  # Key up only
+        self.x = x              # Click position in screen coordinates
+        self.y = y
+        self.right = right      # Right instead of left click
+        self.delay = delay      # Seconds to wait before this action
+
+    def __repr__(self):
+        if self.kind == 'click':
+            return f"InputAction(click {'right' if self.right else 'left'} at ({self.x}, {self.y}))"
+        mode = 'release' if self.release else 'hold' if self.hold else 'press'
+        return f"InputAction({mode} {self.key})"
+
+
+class KeyStateTracker:
+    """Keys held down, as queued and as sent
+
+    `wanted` is what will be held once the queued actions are sent and
+    decides which actions are no-ops: holding a key that is already held or
+    releasing one that is not. `held` is what the desktop really has down.
+    """
+
+    def __init__(self):
+        self.wanted = set()
+        self.held = set()
+        self.suppressed = 0  # No-op actions dropped
+        self._lock = threading.Lock()
+
+    def accept(self, action):
+        """Updates the queued state, returns False if the action changes nothing"""
+        if action.kind != 'key':
+            return True
+        with self._lock:
+            if action.release:
+                if action.key not in self.wanted:
+                    self.suppressed += 1
+                    return False
+                self.wanted.discard(action.key)
+            elif action.hold:
+                if action.key in self.wanted:
+                    self.suppressed += 1
+                    return False
+                self.wanted.add(action.key)
+            else:
+                self.wanted.discard(action.key)  # A press ends with the key up
+            return True
+
+    def sent(self, action):
+        """Updates the desktop state after an action went out"""
+        if action.kind != 'key':
+            return
+        with self._lock:
+            if action.hold and not action.release:
+                self.held.add(action.key)
+            else:
+                self.held.discard(action.key)
+
+    def revert(self):
+        """Makes the queued state the sent state again, after queued actions were dropped"""
+        with self._lock:
+            self.wanted = set(self.held)
+
+    def reset(self):
+        """Forgets all keys, after they have been released"""
+        with self._lock:
+            self.wanted.clear()
+            self.held.clear()
+
+
+class InputDispatcher:
+    """Sends key and mouse actions to the game window from a queue
+
+    Every burst focuses the game window once, sends its actions and gives the
+    focus back once. On its own thread (start()), actions that arrive within
+    group_window of each other form one burst, e.g. releasing one movement key
+    and holding the next, or the W + F of a revive. The delay of an action is
+    kept inside the burst. Without the thread every action is sent at once.
+
+    Held keys are tracked (`keys`), so holding a held key or releasing a
+    released one sends nothing. If sending fails, every held key is released.
+    """
+
+    def __init__(self, window_backend, input_backend, handle_func, clock=None, group_window=DEFAULT_GROUP_WINDOW,
+                 focus_delay=DEFAULT_FOCUS_DELAY, on_sent=None, log=None):
+        """Creates the dispatcher
+
+        Args:
+            window_backend: WindowBackend used to focus the game window
+            input_backend: InputBackend sending the keys and clicks
+            handle_func: Returns the game window handle, falsy drops the actions
+            clock: Clock for the focus and action delays
+            group_window: Seconds to wait for further actions of a burst
+            focus_delay: Seconds between focusing the window and the first action
+            on_sent: Optional callable run after every burst (the screen reacts to it)
+            log: Optional callable(message, level) for send errors, printed without
+        """
+        self.window_backend = window_backend
+        self.input_backend = input_backend
+        self.handle_func = handle_func
+        self.clock = clock or SystemClock()
+        self.group_window = group_window
+        self.focus_delay = focus_delay
+        self.on_sent = on_sent
+        self.log = log or (lambda message, level: print(message))
+        self.keys = KeyStateTracker()
+        self._queue = queue.Queue()
+        self._pending = 0  # Actions queued or being sent
+        self._idle = threading.Condition()
+        self.thread = None
+        self.running = False
+
+        # Statistics
+        self.bursts = 0   # Focus cycles
+        self.actions = 0  # Actions sent
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='input')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        """Sends what is still queued, then stops the thread"""
+        if not self.running:
+            return
+        self.flush(timeout)
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=timeout)
+        self.thread = None
+
+    @property
+    def busy(self):
+        """True while actions are queued or being sent"""
+        return self._pending > 0
+
+    def flush(self, timeout=None):
+        """Waits until every queued action has been sent"""
+        if not self.running:
+            return True
+        with self._idle:
+            return self._idle.wait_for(lambda: not self.busy, timeout)
+
+    def key(self, key, hold=False, release=False, delay=0.0):
+        """Queues a key press, hold (key down) or release (key up)"""
+        self._submit([InputAction('key', key, hold=hold, release=release, delay=delay)])
+
+    def switch_key(self, old_key, new_key):
+        """Releases old_key and holds new_key in the same burst"""
+        actions = [InputAction('key', new_key, hold=True)]
+        if old_key:
+            actions.insert(0, InputAction('key', old_key, release=True))
+        self._submit(actions)
+
+    def release_all(self):
+        """Releases every held key (queued holds included) in one burst"""
+        self._submit([InputAction('key', key, release=True) for key in sorted(self.keys.wanted)])
+
+    def click(self, x, y, right=False, delay=0.0):
+        """Queues a mouse click at screen position (x, y)"""
+        self._submit([InputAction('click', x=x, y=y, right=right, delay=delay)])
+
+    def _submit(self, actions):
+        """Queues actions that are always sent in the same burst"""
+        actions = [action for action in actions if self.keys.accept(action)]
+        if not actions:
+            return
+        if self.running:
+            with self._idle:
+                self._pending += len(actions)
+            self._queue.put(actions)
+        else:
+            self._send(actions)
+
+    def _run(self):
+        while self.running:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            burst = list(first)
+            # Collect the actions that follow closely
+            while True:
+                try:
+                    burst.extend(self._queue.get(timeout=self.group_window))
+                except queue.Empty:
+                    break
+            try:
+                self._send(burst)
+            finally:
+                with self._idle:
+                    self._pending -= len(burst)
+                    self._idle.notify_all()
+
+    def _send(self, actions):
+        """Sends actions in one focus cycle"""
+        handle = self.handle_func()
+        if not handle:
+            # accept() already counted these actions as sent, take that back
+            self.keys.revert()
+            return
+        try:
+            # Save the current active window
+            current_window = self.window_backend.get_foreground()
+
+            # Activate Temtem window
+            self.window_backend.set_foreground(handle)
+            self.clock.sleep(self.focus_delay)
+            try:
+                for action in actions:
+                    self.clock.sleep(action.delay)
+                    self._perform(action)
+                    self.keys.sent(action)
+                    self.actions += 1
+            finally:
+                # Restore the original window
+                if current_window and current_window != handle:
+                    self.window_backend.set_foreground(current_window)
+            self.bursts += 1
+
+        except Exception as e:
+            self.log(f"Error sending input: {e}", ERROR)
+            self._release_held()
+        finally:
+            if self.on_sent:
+                self.on_sent()
+
+    def _release_held(self):
+        """Releases every key the desktop has down, after a failed burst"""
+        for key in sorted(self.keys.held):
+            try:
+                self.input_backend.key_up(key)
+            except Exception:
+                pass  # Best effort, the key state is unknown anyway
+        self.keys.reset()
+
+    def _perform(self, action):
+        if action.kind == 'click':
+            self.input_backend.move_mouse(action.x, action.y)
+            self.input_backend.mouse_down(action.x, action.y, right=action.right)
+            self.clock.sleep(0.1)
+            self.input_backend.mouse_up(action.x, action.y, right=action.right)
+        elif action.release:
+            self.input_backend.key_up(action.key)
+        elif action.hold:
+            self.input_backend.key_down(action.key)
+        else:
+            self.input_backend.press(action.key)
@@ -1,6 +1,6 @@
 import ctypes
 import time
-from ctypes import wintypes, c_size_t, c_void_p, create_string_buffer, windll
+from ctypes import c_size_t, c_void_p, create_string_buffer, windll
 import win32gui
 import win32process
 import win32api
@@ -15,9 +15,7 @@ PROCESS_VM_READ = 0x0010
 PROCESS_VM_WRITE = 0x0020
 PROCESS_VM_OPERATION = 0x0008
 
-# Keyboard input constants
-INPUT_KEYBOARD = 1
-KEYEVENTF_KEYUP = 0x0002
+# Keyboard input constants (SendInput structures are in input_backend.py)
 KEYEVENTF_UNICODE = 0x0004
 
 VIRTUAL_KEYS = {
@@ -31,36 +29,6 @@ VIRTUAL_KEYS = {
     '6': 0x36
 }
 
-# C structures for SendInput
-class MOUSEINPUT(ctypes.Structure):
-    _fields_ = (("dx", wintypes.LONG),
-                ("dy", wintypes.LONG),
-                ("mouseData", wintypes.DWORD),
-                ("dwFlags", wintypes.DWORD),
-                ("time", wintypes.DWORD),
-                ("dwExtraInfo", ctypes.POINTER(wintypes.ULONG)))
-
-class KEYBDINPUT(ctypes.Structure):
-    _fields_ = (("wVk", wintypes.WORD),
-                ("wScan", wintypes.WORD),
-                ("dwFlags", wintypes.DWORD),
-                ("time", wintypes.DWORD),
-                ("dwExtraInfo", ctypes.POINTER(wintypes.ULONG)))
-
-class HARDWAREINPUT(ctypes.Structure):
-    _fields_ = (("uMsg", wintypes.DWORD),
-                ("wParamL", wintypes.WORD),
-                ("wParamH", wintypes.WORD))
-
-class INPUT(ctypes.Structure):
-    class _INPUT(ctypes.Union):
-        _fields_ = (("ki", KEYBDINPUT),
-                   ("mi", MOUSEINPUT),
-                   ("hi", HARDWAREINPUT))
-    _anonymous_ = ("_input",)
-    _fields_ = (("type", wintypes.DWORD),
-                ("_input", _INPUT))
-
 class MemoryAccess:
     def __init__(self):
         self.process_handle = None
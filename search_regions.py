@@ -0,0 +1,158 @@
+import threading
+
+# Defaults for the learned search regions of a profile
+DEFAULT_MARGIN = 24                # Pixels added around the learned hit box
+DEFAULT_MIN_HITS = 3               # Hits before a region restricts the search
+DEFAULT_FULL_SEARCH_INTERVAL = 25  # Every n-th frame searched for a type scans the full frame
+
+
+class SearchRegions:
+    """Per-type search regions (ROIs) learned from the hit history
+
+    Each template type keeps the bounding box of all its hits. Once a type has
+    enough hits, full searches are restricted to that box plus a margin. Every
+    full_search_interval-th frame searched for a type still scans the whole
+    frame, so a UI element that moved is found again and widens the box. The
+    decision is made once per frame and type, so all templates of a type
+    (kill, kill1, kill2, ...) search the full frame together.
+    """
+
+    def __init__(self, margin=DEFAULT_MARGIN, min_hits=DEFAULT_MIN_HITS,
+                 full_search_interval=DEFAULT_FULL_SEARCH_INTERVAL):
+        self.margin = margin
+        self.min_hits = min_hits
+        self.full_search_interval = full_search_interval
+        self._boxes = {}     # type -> [x1, y1, x2, y2] of all hits
+        self._hits = {}      # type -> number of hits
+        self._frame_size = {}  # type -> (width, height) the box was learned on
+        self._searches = {}  # type -> searched frames since the last full-frame search
+        self._decided = {}   # type -> (frame id, full-frame search) of the last searched frame
+        self.dirty = False   # True if there are unsaved changes
+        self._lock = threading.Lock()
+
+    def record_hit(self, template_type, x, y, w, h, frame_size):
+        """Extends the region of a type by a hit at (x, y) with size (w, h)"""
+        with self._lock:
+            box = self._boxes.get(template_type)
+            if box is None or self._frame_size.get(template_type) != frame_size:
+                # First hit, or the window size changed - start over
+                self._boxes[template_type] = [x, y, x + w, y + h]
+                self._hits[template_type] = 1
+                self._frame_size[template_type] = frame_size
+                self.dirty = True
+                return
+            if x < box[0] or y < box[1] or x + w > box[2] or y + h > box[3]:
+                box[0] = min(box[0], x)
+                box[1] = min(box[1], y)
+                box[2] = max(box[2], x + w)
+                box[3] = max(box[3], y + h)
+                self.dirty = True
+            if self._hits[template_type] < self.min_hits:
+                self.dirty = True
+            self._hits[template_type] += 1
+
+    def _area(self, template_type, frame_size):
+        box = self._boxes.get(template_type)
+        if (box is None or self._hits.get(template_type, 0) < self.min_hits or
+                self._frame_size.get(template_type) != frame_size):
+            return None
+        width, height = frame_size
+        return (max(0, box[0] - self.margin), max(0, box[1] - self.margin),
+                min(width, box[2] + self.margin), min(height, box[3] + self.margin))
+
+    def area(self, template_type, frame_size):
+        """Returns the learned (x1, y1, x2, y2) area of a type including the margin, or None"""
+        with self._lock:
+            return self._area(template_type, frame_size)
+
+    def region_for(self, template_type, frame_size, frame_id=None):
+        """Returns the (x1, y1, x2, y2) search area of a type, or None for the full frame
+
+        Args:
+            frame_id: Id of the searched frame; every template of the type asking
+                      for the same frame gets the same answer (None counts each call)
+        """
+        with self._lock:
+            area = self._area(template_type, frame_size)
+            if area is None:
+                return None
+            if self._full_search(template_type, frame_id):
+                return None  # Periodic full-frame fallback
+            return area
+
+    def _full_search(self, template_type, frame_id):
+        """Decides once per frame if a type searches the full frame, counting the frame"""
+        decided = self._decided.get(template_type)
+        if frame_id is not None and decided is not None and decided[0] == frame_id:
+            return decided[1]
+        searches = self._searches.get(template_type, 0) + 1
+        full = searches >= self.full_search_interval
+        self._searches[template_type] = 0 if full else searches
+        self._decided[template_type] = (frame_id, full)
+        return full
+
+    def count_search(self, template_type):
+        """Counts a search answered without matching (e.g. by the state cache)
+
+        Returns False once the full-frame fallback of the type is due; the
+        caller then has to really search, and region_for() returns None.
+        """
+        with self._lock:
+            searches = self._searches.get(template_type, 0) + 1
+            if searches >= self.full_search_interval:
+                return False
+            self._searches[template_type] = searches
+            return True
+
+    def fallback_due(self, template_type, frame_id=None):
+        """Returns True if a type searches the full frame on a frame (the next one by default)"""
+        with self._lock:
+            decided = self._decided.get(template_type)
+            if frame_id is not None and decided is not None and decided[0] == frame_id:
+                return decided[1]
+            return self._searches.get(template_type, 0) + 1 >= self.full_search_interval
+
+    def reset(self, template_type=None):
+        """Forgets the learned region of one type, or of all types"""
+        with self._lock:
+            types = [template_type] if template_type else list(self._boxes)
+            for name in types:
+                self._boxes.pop(name, None)
+                self._hits.pop(name, None)
+                self._frame_size.pop(name, None)
+                self._searches.pop(name, None)
+                self._decided.pop(name, None)
+            self.dirty = True
+
+    def to_config(self):
+        """Returns the regions as JSON-serializable profile data"""
+        with self._lock:
+            return {
+                'margin': self.margin,
+                'min_hits': self.min_hits,
+                'full_search_interval': self.full_search_interval,
+                'types': {
+                    name: {
+                        'box': list(box),
+                        'hits': self._hits[name],
+                        'frame_size': list(self._frame_size[name])
+                    }
+                    for name, box in self._boxes.items()
+                }
+            }
+
+    @classmethod
+    def from_config(cls, data):
+        """Creates the regions from profile data (see to_config)"""
+        data = data or {}
+        regions = cls(data.get('margin', DEFAULT_MARGIN),
+                      data.get('min_hits', DEFAULT_MIN_HITS),
+                      data.get('full_search_interval', DEFAULT_FULL_SEARCH_INTERVAL))
+        for name, entry in data.get('types', {}).items():
+            try:
+                regions._boxes[name] = [int(v) for v in entry['box']]
+                regions._hits[name] = int(entry.get('hits', 0))
+                regions._frame_size[name] = tuple(int(v) for v in entry['frame_size'])
+            except (KeyError, TypeError, ValueError):
+                continue  # Skip broken entries, they are learned again
+        return regions
@@ -1,8 +1,6 @@
 import sys
 import os
 import json
-import cv2
-import numpy as np
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
@@ -42,7 +40,8 @@ class SettingsGUI(QWidget):
         self.setAttribute(Qt.WA_TranslucentBackground)
         
         self.log_paused = False  # Status for log pause
-        self.paused_logs = []  # Separate list for paused logs
+        self.rendered_sequence = 0  # Newest log line shown in the log display
+        self.rendered_line = None  # Line id of the last line shown (folded lines get replaced)
         self.current_profile = self.config.get_active_profile()  # Current profile
         self.selected_template_type = None  # Stores the selected template type
         
@@ -51,6 +50,7 @@ class SettingsGUI(QWidget):
         
         self.initUI()
         self.load_settings()
+        self.update_log_display()  # Show the lines logged so far
         self.drag_pos = None
         
         # Position above the main window
@@ -509,10 +509,10 @@ class SettingsGUI(QWidget):
         log_layout.addWidget(self.pause_button)
         
         # Log display
-        self.log_display = QTextEdit()
+        self.log_display = QPlainTextEdit()
         self.log_display.setFont(QFont("Consolas", 8))  # Monospace font
         self.log_display.setStyleSheet("""
-            QTextEdit {
+            QPlainTextEdit {
                 background-color: #1e1e1e;
                 border: 1px solid #3d3d3d;
                 border-radius: 4px;
@@ -538,6 +538,9 @@ class SettingsGUI(QWidget):
             }
         """)
         self.log_display.setReadOnly(True)  # Read-only
+        self.log_display.setPlaceholderText("No logs available")
+        # Only the newest lines are kept, like in the log store
+        self.log_display.setMaximumBlockCount(getattr(self.parent, 'max_logs', 100))
         self.log_display.setMinimumHeight(150)  # Height for about 15 lines
         log_layout.addWidget(self.log_display)
         
@@ -597,12 +600,13 @@ class SettingsGUI(QWidget):
             }
             self.parent.bot.set_thresholds(thresholds)
             
-            # Update profile data
-            profile_data = {
+            # Update profile data, keeping keys without a widget (e.g. timings)
+            profile_data = dict(self.config.get_profile(self.current_profile) or {})
+            profile_data.update({
                 'show_highlight': self.highlight_checkbox.isChecked(),
                 'highlight_duration': self.highlight_duration_spin.value(),
                 'thresholds': thresholds
-            }
+            })
             
             # Save profile with save=True, da dies eine explizite Speicheraktion ist
             self.config.set_profile(self.current_profile, profile_data, save=True)
@@ -652,14 +656,17 @@ class SettingsGUI(QWidget):
             self.died_spin.setValue(thresholds.get('died', 0.8))
             self.map_spin.setValue(thresholds.get('map', 0.95))
             
-            # Update bot settings without saving
-            if self.parent and hasattr(self.parent.bot, 'set_thresholds'):
-                self.parent.bot.thresholds = thresholds.copy()  # Update thresholds directly
-                self.parent.bot.highlight_enabled = profile.get('show_highlight', True)
-                self.parent.bot.highlight_duration = profile.get('highlight_duration', 750)
+            # Regions learned so far belong to the previous profile
+            has_bot = self.parent and hasattr(self.parent, 'bot')
+            if has_bot:
+                self.parent.bot.save_search_regions()
             
             # Set as active profile using the proper method
             self.config.set_active_profile(profile_name)
+            
+            # Apply every setting of the new profile to the bot (clears the state cache)
+            if has_bot:
+                self.parent.bot.load_thresholds()
     
     def create_new_profile(self):
         """Creates a new profile"""
@@ -986,27 +993,30 @@ class SettingsGUI(QWidget):
         self.log_paused = not self.log_paused
         self.pause_button.setText("Resume Log" if self.log_paused else "Pause Log")
         
-        if self.log_paused:
-            # Copy current logs to the pause list
-            self.paused_logs = self.parent.get_log_entries()
-        else:
-            # Clear the pause list
-            self.paused_logs = []
-            
+        # A paused display keeps its lines, resuming catches up
         self.update_log_display()
         
     def update_log_display(self):
-        """Updates the log display"""
-        if not self.log_paused:
-            # Show current logs
-            logs = self.parent.get_log_entries()
-        else:
-            # Show paused logs
-            logs = self.paused_logs
+        """Appends the log lines added since the last update"""
+        log_store = getattr(self.parent, 'log_store', None)
+        if self.log_paused or log_store is None:
+            return
+            
+        entries = log_store.since(self.rendered_sequence)
+        if not entries:
+            return
             
-        # Format logs for display
-        log_text = "\n".join(logs) if logs else "No logs available"
-        self.log_display.setText(log_text)
+        for sequence, line_id, text in entries:
+            if line_id == self.rendered_line:
+                # Folded message whose count grew: rewrite the last line
+                cursor = QTextCursor(self.log_display.document().lastBlock())
+                cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+                cursor.insertText(text)
+            else:
+                self.log_display.appendPlainText(text)
+                self.rendered_line = line_id
+        self.rendered_sequence = entries[-1][0]
+        
         # Scroll to the end
         self.log_display.verticalScrollBar().setValue(
             self.log_display.verticalScrollBar().maximum()
@@ -1055,7 +1065,7 @@ class SettingsGUI(QWidget):
 
     def test_threshold(self, threshold, button):
         """Tests the specified threshold"""
-        if not self.parent or not hasattr(self.parent.bot, 'find_image_in_window'):
+        if not self.parent or not hasattr(self.parent.bot, 'test_match'):
             return
             
         # Ensure the bot is initialized
@@ -1065,17 +1075,9 @@ class SettingsGUI(QWidget):
                 self.parent.add_log_entry("Error: Could not find Temtem window")
                 return
                 
-        # Save current thresholds
-        current_thresholds = {}
-        try:
-            with open('config.json', 'r') as f:
-                config = json.load(f)
-                current_thresholds = config.get('thresholds', {})
-        except (FileNotFoundError, json.JSONDecodeError):
-            pass
-            
-        # Temporarily set the new threshold
-        test_thresholds = current_thresholds.copy()
+        # Threshold under test, compared with the match confidence directly
+        # so the profile thresholds stay untouched
+        test_thresholds = {}
         
         # Dynamically collect all matching templates
         templates_dict = {}  # Store template and name
@@ -1116,8 +1118,12 @@ class SettingsGUI(QWidget):
             self.parent.add_log_entry(f"Error: No templates found for {threshold}")
             return
             
-        # Set test thresholds
-        self.parent.bot.set_thresholds(test_thresholds)
+        # One private full frame for all templates of this test, the bot's
+        # current frame stays as it is
+        frame = self.parent.bot.grab_full_frame()
+        if frame is None:
+            self.parent.add_log_entry("Error: Could not capture the Temtem window")
+            return
         
         # Create temporary highlight window for Temtem
         highlight = QWidget(None)
@@ -1140,41 +1146,30 @@ class SettingsGUI(QWidget):
         found = False
         found_template_name = None
         confidence_results = []  # Store all confidence results
+        mode_results = []  # Confidence of every template in every match mode
+        
+        threshold_val = test_thresholds.get(threshold, 0.95)  # Default to 0.95 if not found
         
         for template_name, template in templates_dict.items():
             if template is None:
                 continue
                 
             try:
-                # Get correct screen coordinates
-                monitor = self.parent.bot.get_screen_coordinates(self.parent.bot.window_handle)
-                if not monitor:
-                    continue
-                    
-                # Capture window content using MSS
-                sct = self.parent.bot._ensure_mss()
-                screenshot = sct.grab(monitor)
-                
-                # Convert MSS screenshot to OpenCV format
-                screenshot_cv = cv2.cvtColor(np.array(screenshot), cv2.COLOR_BGRA2BGR)
-                template_cv = cv2.cvtColor(np.array(template), cv2.COLOR_RGB2BGR)
-                
-                # Template matching
-                result = cv2.matchTemplate(screenshot_cv, template_cv, cv2.TM_SQDIFF_NORMED)
-                min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-                
-                # In TM_SQDIFF_NORMED, min_val is the best match (0 = perfect, 1 = no match)
-                confidence = 1.0 - min_val
+                # Plain full-frame search, compared with the slider value
+                confidence, (match_x, match_y), (w, h) = self.parent.bot.test_match(template, frame)
                 confidence_results.append((template_name, confidence))  # Store result
                 
-                # Get threshold value for current template type
-                threshold_val = test_thresholds.get(threshold, 0.95)  # Default to 0.95 if not found
+                # Same frame in grayscale and single channels for comparison
+                modes = self.parent.bot.compare_match_modes(template, frame)
+                configured = self.parent.bot.match_modes.get(threshold, 'bgr')
+                mode_results.append((template_name, ", ".join(
+                    f"{'*' if mode == configured else ''}{mode} {confidence:.3f}"
+                    for mode, confidence in modes.items())))
                 
                 if confidence >= threshold_val:
                     # Calculate the position of the found template
-                    h, w = template_cv.shape[:2]
-                    x = min_loc[0] + monitor["left"]
-                    y = min_loc[1] + monitor["top"]
+                    x = match_x + frame.monitor["left"]
+                    y = match_y + frame.monitor["top"]
                     
                     # Show red circle at the found position
                     padding = 10
@@ -1189,9 +1184,10 @@ class SettingsGUI(QWidget):
             except Exception as e:
                 self.parent.add_log_entry(f"Test error: {str(e)}")
                 
-        # Restore original thresholds
-        self.parent.bot.set_thresholds(current_thresholds)
-        
+        # Confidence per match mode, the configured mode is marked with *
+        for template_name, modes in mode_results:
+            self.parent.add_log_entry(f"Modes {template_name}: {modes}")
+            
         # Show result
         if found:
             self.parent.add_log_entry(f"Test {threshold}: Template '{found_template_name}' found!")
@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+# Defaults for the state cache of a profile
+DEFAULT_CACHE_SIZE = 64      # Screens remembered, 0 disables the cache
+DEFAULT_HASH_TOLERANCE = 4   # Differing hash bits still counted as the same screen
+HASH_SIZE = 8                # Difference hash grid per area (HASH_SIZE**2 bits)
+
+
+def difference_hash(image, size=HASH_SIZE):
+    """Returns the difference hash (dHash) of a grayscale image as packed bits
+
+    The image is shrunk to (size + 1) x size and every bit tells whether a
+    pixel is brighter than its left neighbour, so the hash survives noise and
+    small brightness changes but not a different layout.
+    """
+    small = cv2.resize(image, (size + 1, size), interpolation=cv2.INTER_AREA)
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+class StateCache:
+    """LRU cache of classified screens, keyed by perceptual hashes of their areas
+
+    A key is the list of watched template types plus their learned areas; the
+    value is the difference hash of every area, the classified state and the
+    MatchResult behind it. A frame whose hash differs in at most tolerance
+    bits from a cached one gets that state without any template matching.
+    """
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE, tolerance=DEFAULT_HASH_TOLERANCE):
+        self.size = size
+        self.tolerance = tolerance
+        self._entries = OrderedDict()  # (key, hash bytes) -> (key, hash, state, result)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def configure(self, size, tolerance):
+        """Applies profile settings, shrinking the cache if needed"""
+        with self._lock:
+            self.size = size
+            self.tolerance = tolerance
+            while len(self._entries) > max(0, size):
+                self._entries.popitem(last=False)
+
+    def lookup(self, key, frame_hash):
+        """Returns the cached (state, result) closest to frame_hash, or None"""
+        if self.size <= 0:
+            return None
+        with self._lock:
+            best = None
+            best_distance = self.tolerance + 1
+            for entry_id, (entry_key, entry_hash, state, result) in self._entries.items():
+                if entry_key != key:
+                    continue
+                distance = int(np.unpackbits(entry_hash ^ frame_hash).sum())
+                if distance < best_distance:
+                    best, best_distance = entry_id, distance
+                    if distance == 0:
+                        break
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best)
+            return self._entries[best][2:]
+
+    def store(self, key, frame_hash, state, result):
+        """Remembers the state classified for a frame hash"""
+        if self.size <= 0:
+            return
+        with self._lock:
+            entry_id = (key, frame_hash.tobytes())
+            self._entries[entry_id] = (key, frame_hash, state, result)
+            self._entries.move_to_end(entry_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Forgets all screens, e.g. after thresholds or templates changed"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,206 @@
+from collections import deque
+
+# Screens reported by the classifier, in detection priority order.
+# 'none' means no template matched (loading, animations, transitions).
+SCREENS = ('map', 'died', 'battle_menu', 'kill', 'chose', 'overload', 'none')
+
+# Default target state for every screen
+ROUTES = {
+    'map': 'overworld',
+    'died': 'died',
+    'battle_menu': 'battle_menu',
+    'kill': 'kill',
+    'chose': 'chose',
+    'overload': 'overload',
+    'none': 'loading'
+}
+
+
+class StateSpec:
+    """Declarative description of one state of the bot"""
+
+    def __init__(self, name, transitions, message=None, action=None, tick=None, on_exit=None,
+                 min_dwell=0.0, timeout=None, on_timeout='unknown',
+                 retry_after=None, max_retries=0, on_exhausted='unknown', in_battle=False, watch=None):
+        """Creates a state
+
+        Args:
+            name: State name
+            transitions: Dictionary screen -> next state, a missing screen keeps the state
+            message: Log message when the state is entered
+            action: Action name executed when the state is entered
+            tick: Action name executed on every step while in the state
+            on_exit: Action name executed when the state is left
+            min_dwell: Seconds before screen transitions are evaluated
+            timeout: Seconds after which the state is left towards on_timeout
+            retry_after: Seconds after which the action is repeated while the
+                         screen still points to this state
+            max_retries: Number of repetitions before on_exhausted is entered
+            in_battle: True for states inside a battle
+            watch: Template types classified in this state, None for all.
+                   Fewer types mean less matching and a smaller region capture
+        """
+        self.name = name
+        self.transitions = transitions
+        self.message = message
+        self.action = action
+        self.tick = tick
+        self.on_exit = on_exit
+        self.min_dwell = min_dwell
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.retry_after = retry_after
+        self.max_retries = max_retries
+        self.on_exhausted = on_exhausted
+        self.in_battle = in_battle
+        self.watch = watch
+
+
+def _routes(**overrides):
+    """ROUTES with some screens pointing elsewhere"""
+    routes = dict(ROUTES)
+    routes.update(overrides)
+    return routes
+
+
+def build_battle_table(timings):
+    """Builds the overworld/battle transition table
+
+    Args:
+        timings: Battle timings of the profile (see autolevel.DEFAULT_TIMINGS)
+
+    Returns:
+        Dictionary with state names as keys and StateSpec objects as values
+    """
+    ui_timeout = timings['ui_timeout']
+    states = [
+        StateSpec('unknown', ROUTES, message="Status unknown"),
+        # Only the map icon is watched while walking, its absence means loading
+        StateSpec('overworld', ROUTES, message="On map",
+                  tick='walk', on_exit='release_keys', watch=('map',)),
+        StateSpec('loading', ROUTES, message="Loading...",
+                  timeout=ui_timeout, on_timeout='unknown'),
+
+        # Select the attack, then confirm it once the minimum pause is over.
+        # The technique/target screen after the number key has no template,
+        # so a vanished menu means the attack was selected
+        StateSpec('battle_menu', _routes(battle_menu='battle_menu', none='attack_selected'), message="In battle",
+                  action='select_attack', min_dwell=timings['after_attack_key'],
+                  timeout=timings['after_attack_key'], on_timeout='attack_selected', in_battle=True),
+        StateSpec('attack_selected', _routes(battle_menu='attack_selected', none='animation'),
+                  action='confirm_attack', min_dwell=timings['after_confirm_key'],
+                  timeout=timings['confirm_timeout'], on_timeout='battle_menu', in_battle=True),
+        # Whatever follows the animation decides the next state
+        StateSpec('animation', _routes(none='animation'), message="Waiting for next possible action...",
+                  timeout=ui_timeout, on_timeout='unknown', in_battle=True),
+
+        StateSpec('kill', _routes(kill='kill'), message="Kill button detected",
+                  action='confirm_kill', retry_after=1.0, max_retries=3, in_battle=True),
+        StateSpec('chose', _routes(chose='chose'), message="Chose dialog detected",
+                  action='confirm_chose', retry_after=0.5, max_retries=4,
+                  on_exhausted='chose_stuck', in_battle=True),
+        StateSpec('chose_stuck', _routes(chose='chose_stuck'), message="Chose dialog stuck - using right-click fallback",
+                  action='dismiss_chose', retry_after=1.0, max_retries=2, in_battle=True),
+        StateSpec('overload', _routes(overload='overload'), message="Overload dialog detected",
+                  action='confirm_overload', retry_after=1.0, max_retries=3, in_battle=True),
+        StateSpec('died', _routes(died='died'), message="Died - attempting revival",
+                  action='revive', retry_after=1.0, max_retries=4, in_battle=True),
+    ]
+    return {spec.name: spec for spec in states}
+
+
+class StateMachine:
+    """Runs a transition table against the classified screen of each tick
+
+    The machine never recurses: every call to step() evaluates at most one
+    transition and runs at most one action, so the work per tick is bounded.
+    """
+
+    def __init__(self, table, actions, clock, initial='unknown', log=None, history_size=50):
+        """Creates the state machine
+
+        Args:
+            table: Dictionary state name -> StateSpec (see build_battle_table)
+            actions: Dictionary action name -> callable without arguments
+            clock: Clock used for dwell times, timeouts and retries
+            initial: Name of the start state
+            log: Optional callable receiving log messages
+            history_size: Number of transitions kept for inspection
+        """
+        missing = [spec.name for spec in table.values()
+                   for target in list(spec.transitions.values()) + [spec.on_timeout, spec.on_exhausted]
+                   if target not in table]
+        if missing:
+            raise ValueError(f"Transitions to unknown states in: {', '.join(sorted(set(missing)))}")
+        self.table = table
+        self.actions = actions
+        self.clock = clock
+        self.initial = initial
+        self.log = log
+        self.history = deque(maxlen=history_size)  # (time, from, to, reason)
+        self.reset()
+
+    def reset(self):
+        """Returns to the start state without running actions"""
+        self.state = self.initial
+        self.entered_at = self.clock.time()
+        self.last_action = self.entered_at
+        self.retries = 0
+
+    @property
+    def spec(self):
+        return self.table[self.state]
+
+    @property
+    def in_battle(self):
+        return self.spec.in_battle
+
+    def _run_action(self, name):
+        if name:
+            self.actions[name]()
+
+    def enter(self, state, reason):
+        """Leaves the current state and enters another one"""
+        previous = self.spec
+        self._run_action(previous.on_exit)
+        self.history.append((self.clock.time(), self.state, state, reason))
+        self.state = state
+        self.entered_at = self.clock.time()
+        self.retries = 0
+        spec = self.spec
+        if spec.message and self.log:
+            self.log(spec.message)
+        self._run_action(spec.action)
+        self.last_action = self.clock.time()
+
+    def next_state(self, screen, now):
+        """Returns (target, reason) for a screen without side effects, target None keeps the state"""
+        spec = self.spec
+        elapsed = now - self.entered_at
+        if elapsed >= spec.min_dwell:
+            target = spec.transitions.get(screen, self.state)
+            if target != self.state:
+                return target, screen
+            # The screen still belongs to this state: repeat the action if it had no effect
+            if spec.retry_after is not None and now - self.last_action >= spec.retry_after:
+                if self.retries >= spec.max_retries:
+                    return spec.on_exhausted, 'exhausted'
+                return None, 'retry'
+        if spec.timeout is not None and elapsed >= spec.timeout:
+            return spec.on_timeout, 'timeout'
+        return None, None
+
+    def step(self, screen):
+        """Processes the screen of one tick and returns the current state"""
+        target, reason = self.next_state(screen, self.clock.time())
+        if target is not None:
+            self.enter(target, reason)
+        elif reason == 'retry':
+            self.retries += 1
+            if self.log:
+                self.log(f"Retrying {self.state} ({self.retries}/{self.spec.max_retries})")
+            self._run_action(self.spec.action)
+            self.last_action = self.clock.time()
+        elif self.spec.tick:
+            self._run_action(self.spec.tick)
+        return self.state
@@ -2,9 +2,6 @@ import os
 import re
 from PIL import Image, ImageGrab
 import glob
-import mss
-import mss.tools
-import win32gui
 import numpy as np
 import cv2
 from send2trash import send2trash
@@ -13,16 +10,18 @@ from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QSho
 from PyQt5.QtCore import Qt, QSize, QTimer
 from PyQt5.QtGui import QPixmap, QImage, QFont
 import sys
-import win32api
 import json
 from config_manager import ConfigManager
+from frame_capture import MSSFrameSource
+from window_backend import default_window_backend
 
 
 class TemplateManager:
-    def __init__(self, stdout=None):
+    def __init__(self, stdout=None, window_backend=None):
         self.templates = {}  # Will be filled dynamically
+        self.window_backend = window_backend or default_window_backend()
         self.img_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'img')
-        self._sct = None  # MSS instance for screenshots
+        self.frame_source = MSSFrameSource(lambda: None)  # Screenshots go through the capture layer
         self.stdout = stdout or sys.__stdout__  # Use custom stdout if provided, otherwise use system stdout
         
         # Initialize config manager
@@ -33,32 +32,11 @@ class TemplateManager:
         self.stdout.write(message + "\n")
         self.stdout.flush()
         
-    def _ensure_mss(self):
-        """Ensures MSS is initialized"""
-        if self._sct is None:
-            self._sct = mss.mss()
-        return self._sct
-        
     def get_screen_coordinates(self, window_handle):
         """Gets the correct screen coordinates for a window"""
         try:
-            # Get the window rect
-            window_rect = win32gui.GetWindowRect(window_handle)
-            client_rect = win32gui.GetClientRect(window_handle)
-            
-            # Convert client coordinates to screen coordinates
-            left, top = win32gui.ClientToScreen(window_handle, (0, 0))
-            right, bottom = win32gui.ClientToScreen(window_handle, (client_rect[2], client_rect[3]))
-            
-            # Create monitor dict for MSS
-            monitor = {
-                "top": top,
-                "left": left,
-                "width": right - left,
-                "height": bottom - top
-            }
-            
-            return monitor
+            # Client area as monitor dict for MSS
+            return self.window_backend.client_area(window_handle)
             
         except Exception as e:
             print(f"Error getting screen coordinates: {e}")
@@ -75,8 +53,6 @@ Returns:
     PIL Image or None on error
 """
         try:
-            sct = self._ensure_mss()
-            
             if window_handle:
                 # Screenshot of specific window
                 monitor = self.get_screen_coordinates(window_handle)
@@ -89,20 +65,19 @@ Returns:
                     monitor["top"] += region[1]
                     monitor["width"] = region[2]
                     monitor["height"] = region[3]
-                    
-                screenshot = sct.grab(monitor)
                 
             else:
                 # Screenshot of entire screen or region
                 if region:
                     monitor = {"top": region[1], "left": region[0], 
                              "width": region[2], "height": region[3]}
-                    screenshot = sct.grab(monitor)
                 else:
-                    screenshot = sct.grab(sct.monitors[0])
+                    monitor = self.frame_source.screen_area()
+                    
+            image = self.frame_source.grab_area(monitor)
             
             # Convert to PIL Image
-            img = Image.frombytes("RGB", screenshot.size, screenshot.rgb)
+            img = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
             return img
             
         except Exception as e:
@@ -645,8 +620,7 @@ Returns:
                     name_input.selectAll()
                     
                     # Zentriere Dialog
-                    screen_width = win32gui.GetSystemMetrics(0)
-                    screen_height = win32gui.GetSystemMetrics(1)
+                    screen_width, screen_height = self.window_backend.screen_size()
                     x = (screen_width - rename_dialog.width()) // 2
                     y = (screen_height - rename_dialog.height()) // 2
                     rename_dialog.move(x, y)
@@ -674,8 +648,7 @@ Returns:
             
     def __del__(self):
         """Cleanup MSS when object is destroyed"""
-        if self._sct:
-            self._sct.close()
+        self.frame_source.close()
 
     def load_templates(self):
         """Loads all templates from the img folder"""
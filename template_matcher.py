@@ -0,0 +1,366 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+# Coarse level of the pyramid strategy: 2 matches at 1/4 resolution first
+PYRAMID_LEVELS = 2
+
+# Smallest template side (pixels) still matched on a coarse level
+MIN_PYRAMID_SIZE = 8
+
+# Change detection: frames are compared as grayscale thumbnails at 1/2**CHANGE_LEVEL
+CHANGE_LEVEL = 3
+DEFAULT_CHANGE_TOLERANCE = 8     # Largest thumbnail difference (0-255) counted as unchanged
+DEFAULT_MAX_REUSE_AGE = 0.5      # Seconds a result may be carried over, 0 disables reuse
+
+
+def match_template(image, template, mode=None):
+    """Returns (confidence, location) of the best match of a compiled template
+
+    TM_SQDIFF_NORMED gives 0 for a perfect match, so confidence is 1 - min_val.
+    image must already be in the match mode (the template's own by default).
+    """
+    result = cv2.matchTemplate(image, template.pixels(mode), cv2.TM_SQDIFF_NORMED)
+    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+    return 1.0 - min_val, min_loc
+
+
+def match_template_pyramid(image, template, levels=PYRAMID_LEVELS, frame=None):
+    """Coarse-to-fine match: downscaled search, then a full-resolution refine
+
+    The frame and the template are matched at 1/2**levels resolution first.
+    The full-resolution match then only runs in a small window around the
+    coarse peak. Returns (confidence, location) like match_template.
+
+    Args:
+        frame: Optional Frame whose pixels are `image`, its downscaled copy is reused
+    """
+    # Small templates lose too much detail, use fewer levels for them
+    while levels > 0 and min(template.shape) >> levels < MIN_PYRAMID_SIZE:
+        levels -= 1
+    if levels == 0:
+        return match_template(image, template)
+
+    factor = 1 << levels
+    if frame is not None and frame.pixels(template.mode) is image:
+        small_image = frame.scaled(levels, template.mode)
+    else:
+        small_image = cv2.resize(image, (image.shape[1] // factor, image.shape[0] // factor),
+                                 interpolation=cv2.INTER_AREA)
+    small_template = template.scaled(levels)
+    if (small_image.shape[0] < small_template.shape[0] or
+            small_image.shape[1] < small_template.shape[1]):
+        return match_template(image, template)
+
+    result = cv2.matchTemplate(small_image, small_template, cv2.TM_SQDIFF_NORMED)
+    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+
+    # Refine at full resolution in a window of +-2 coarse pixels around the peak
+    pad = 2 * factor
+    height, width = image.shape[:2]
+    x1 = max(0, min_loc[0] * factor - pad)
+    y1 = max(0, min_loc[1] * factor - pad)
+    x2 = min(width, min_loc[0] * factor + template.width + pad)
+    y2 = min(height, min_loc[1] * factor + template.height + pad)
+    confidence, (x, y) = match_template(image[y1:y2, x1:x2], template)
+    return confidence, (x + x1, y + y1)
+
+
+def match_with_strategy(image, template, frame=None):
+    """Matches with the strategy selected for the template's type"""
+    if template.strategy == 'pyramid':
+        return match_template_pyramid(image, template, frame=frame)
+    return match_template(image, template)
+
+
+def match_at(image, template, location):
+    """Returns the confidence of the template exactly at location
+
+    Costs one template area instead of frame x template. Returns None if the
+    template would not fit into the image at that position.
+    """
+    x, y = location
+    h, w = template.shape
+    if x < 0 or y < 0 or y + h > image.shape[0] or x + w > image.shape[1]:
+        return None
+    result = cv2.matchTemplate(image[y:y + h, x:x + w], template.pixels(), cv2.TM_SQDIFF_NORMED)
+    return 1.0 - float(result[0, 0])
+
+
+class MatchResult:
+    """Outcome of matching one template (or the best of a type) against one frame"""
+
+    __slots__ = ('type', 'name', 'confidence', 'threshold', 'x', 'y', 'w', 'h',
+                 'elapsed', 'frame_id', 'skipped')
+
+    def __init__(self, template_type, name=None, confidence=0.0, threshold=1.0,
+                 x=0, y=0, w=0, h=0, elapsed=0.0, frame_id=None, skipped=False):
+        self.type = template_type
+        self.name = name              # Template name, None if the type has no templates
+        self.confidence = confidence  # 1 - TM_SQDIFF_NORMED minimum
+        self.threshold = threshold    # Threshold the confidence is compared with
+        self.x = x                    # Top left corner in frame coordinates
+        self.y = y
+        self.w = w
+        self.h = h
+        self.elapsed = elapsed        # Matching time in seconds
+        self.frame_id = frame_id      # Frame the result belongs to
+        self.skipped = skipped        # True if cancelled by a higher-priority hit
+
+    @property
+    def found(self):
+        return self.name is not None and not self.skipped and self.confidence >= self.threshold
+
+    def __bool__(self):
+        return self.found
+
+    def __repr__(self):
+        return (f"MatchResult({self.type}/{self.name}, confidence={self.confidence:.3f}, "
+                f"found={self.found}, at=({self.x}, {self.y}), {self.elapsed * 1000:.1f} ms)")
+
+
+class MatcherEngine:
+    """Matches many templates against one frame on a bounded thread pool
+
+    cv2.matchTemplate releases the GIL, so the templates of all requested
+    types run at the same time. Types are given in priority order: once a type
+    is confirmed, the queued work of all lower-priority types is cancelled.
+    Results are cached per frame, so asking again in the same tick is free.
+
+    Every template first verifies its last and typical hit position directly
+    (one template area of work), only a miss there runs the full search. The
+    full search is cropped to the learned region of the template type.
+
+    If the area a template is searched in has not changed since its last
+    search, that result is carried over to the new frame instead (at most
+    max_reuse_age seconds), so idle and animation ticks cost almost nothing.
+    """
+
+    def __init__(self, registry, max_workers=None, regions=None):
+        """Creates the engine
+
+        Args:
+            registry: TemplateRegistry providing the compiled templates
+            max_workers: Size of the thread pool, defaults to the CPU count (at most 8)
+            regions: Optional SearchRegions restricting the search per type
+        """
+        self.registry = registry
+        self.regions = regions
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self._pool = None
+        self._cache = {}  # id(template) -> (template, MatchResult) for the cached frame
+        self._cache_frame_id = None
+        self._previous = {}  # id(template) -> (template, MatchResult, thumbnail, area, timestamp)
+        self._lock = threading.Lock()
+
+        # Change detection, see the class docstring
+        self.change_tolerance = DEFAULT_CHANGE_TOLERANCE
+        self.max_reuse_age = DEFAULT_MAX_REUSE_AGE
+
+        # Counters of known-location verification, region searches and reused results
+        self.fast_hits = 0
+        self.region_searches = 0
+        self.full_searches = 0
+        self.reused = 0
+
+    def _count(self, counter):
+        """Increments a statistics counter, the pool threads update them concurrently"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='matcher')
+        return self._pool
+
+    def _cached(self, frame, template):
+        with self._lock:
+            if self._cache_frame_id != frame.frame_id:
+                self._cache = {}
+                self._cache_frame_id = frame.frame_id
+                return None
+            entry = self._cache.get(id(template))
+        return entry[1] if entry else None
+
+    def match(self, frame, template):
+        """Matches one compiled template against a Frame, cached per frame id"""
+        result = self._cached(frame, template)
+        if result is not None:
+            return result
+
+        start = time.perf_counter()
+        # The periodic full-frame search must not be answered by a shortcut
+        full_search = (self.regions is not None and not frame.is_partial and
+                       self.regions.fallback_due(template.type, frame.frame_id))
+        result = None if full_search else self._reuse(frame, template, start)
+        if result is None:
+            confidence, location = self._search(frame, template, full_search)
+            result = MatchResult(template.type, template.name, confidence, template.threshold,
+                                 location[0], location[1], template.width, template.height,
+                                 time.perf_counter() - start, frame.frame_id)
+            self._remember(frame, template, result)
+        with self._lock:
+            if self._cache_frame_id == frame.frame_id:
+                # The template is kept with the result so its id() stays unique
+                self._cache[id(template)] = (template, result)
+        return result
+
+    def _change_area(self, frame, template):
+        """Returns the area whose changes can alter the result of a template"""
+        area = self.regions.area(template.type, (frame.width, frame.height)) if self.regions else None
+        return area or (0, 0, frame.width, frame.height)
+
+    def _thumbnail(self, frame, area):
+        """Returns the grayscale thumbnail of an area, the frame thumbnail is built once"""
+        thumbnail = frame.scaled(CHANGE_LEVEL, 'gray')
+        factor = 1 << CHANGE_LEVEL
+        x1, y1, x2, y2 = area
+        return thumbnail[y1 // factor:-(-y2 // factor), x1 // factor:-(-x2 // factor)]
+
+    def _remember(self, frame, template, result):
+        """Keeps a searched result and the look of its area for later frames"""
+        if not self.max_reuse_age:
+            return
+        area = self._change_area(frame, template)
+        if not frame.covers(*area):
+            return  # Part of the area was not captured, nothing to compare with later
+        entry = (template, result, self._thumbnail(frame, area).copy(), area, frame.timestamp)
+        with self._lock:
+            self._previous[id(template)] = entry
+
+    def _reuse(self, frame, template, start):
+        """Returns the previous result of a template if its area did not change, else None"""
+        if not self.max_reuse_age:
+            return None
+        with self._lock:
+            entry = self._previous.get(id(template))
+        if entry is None:
+            return None
+        _, previous, thumbnail, area, timestamp = entry
+        if frame.timestamp - timestamp > self.max_reuse_age:
+            return None
+        # The area may have grown since, and must have been captured this time too
+        if area != self._change_area(frame, template) or not frame.covers(*area):
+            return None
+        current = self._thumbnail(frame, area)
+        if current.shape != thumbnail.shape or cv2.absdiff(current, thumbnail).max() > self.change_tolerance:
+            return None
+
+        self._count('reused')
+        return MatchResult(previous.type, previous.name, previous.confidence, template.threshold,
+                           previous.x, previous.y, previous.w, previous.h,
+                           time.perf_counter() - start, frame.frame_id)
+
+    def _search(self, frame, template, full_search=False):
+        """Verifies the known hit positions first, falls back to a region or full search"""
+        image = frame.pixels(template.mode)
+        frame_size = (frame.width, frame.height)
+        for location in () if full_search else template.known_locations():
+            if not frame.covers(location[0], location[1],
+                                location[0] + template.width, location[1] + template.height):
+                continue
+            confidence = match_at(image, template, location)
+            if confidence is not None and confidence >= template.threshold:
+                self._count('fast_hits')
+                self._record_hit(template, location, frame_size)
+                return confidence, location
+
+        if frame.is_partial:
+            confidence, location = self._search_captured(frame, template, frame_size)
+        else:
+            confidence, location = self._search_full(frame, template, frame_size)
+        if confidence >= template.threshold:
+            self._record_hit(template, location, frame_size)
+        return confidence, location
+
+    def _search_captured(self, frame, template, frame_size):
+        """Searches only the rects a region capture filled"""
+        # The area of the type itself if it was captured, else every rect
+        area = self.regions.area(template.type, frame_size) if self.regions else None
+        rects = [area] if area and frame.covers(*area) else frame.regions
+        best = (0.0, (0, 0))
+        for x1, y1, x2, y2 in rects:
+            if x2 - x1 < template.width or y2 - y1 < template.height:
+                continue
+            self._count('region_searches')
+            confidence, (x, y) = match_with_strategy(frame.pixels(template.mode)[y1:y2, x1:x2], template)
+            if confidence > best[0]:
+                best = (confidence, (x + x1, y + y1))
+        return best
+
+    def _search_full(self, frame, template, frame_size):
+        """Searches the learned region of the type, or the whole frame"""
+        image = frame.pixels(template.mode)
+        region = self.regions.region_for(template.type, frame_size, frame.frame_id) if self.regions else None
+        if region and region[2] - region[0] >= template.width and region[3] - region[1] >= template.height:
+            # Crop the shared frame to the learned region (a view, no copy)
+            x1, y1, x2, y2 = region
+            self._count('region_searches')
+            confidence, (x, y) = match_with_strategy(image[y1:y2, x1:x2], template)
+            location = (x + x1, y + y1)
+        else:
+            self._count('full_searches')
+            confidence, location = match_with_strategy(image, template, frame)
+        return confidence, location
+
+    def _record_hit(self, template, location, frame_size):
+        template.record_hit(location)
+        if self.regions:
+            self.regions.record_hit(template.type, location[0], location[1],
+                                    template.width, template.height, frame_size)
+
+    def best_of_type(self, frame, template_type):
+        """Returns the best MatchResult of all templates of one type"""
+        return self.evaluate(frame, [template_type], stop_on_found=False)[template_type]
+
+    def evaluate(self, frame, types, stop_on_found=True):
+        """Matches all templates of the given types against one Frame
+
+        Args:
+            frame: Frame to search (usually the tick's shared snapshot)
+            types: Template types in priority order
+            stop_on_found: Cancel lower-priority types once a type is confirmed
+
+        Returns:
+            Dictionary with the best MatchResult for every requested type
+        """
+        pool = self._ensure_pool()
+        pending = [
+            (template_type, [pool.submit(self.match, frame, template)
+                             for template in self.registry.of_type(template_type)])
+            for template_type in types
+        ]
+
+        results = {}
+        confirmed = False
+        for template_type, futures in pending:
+            if confirmed:
+                for future in futures:
+                    future.cancel()
+                results[template_type] = MatchResult(template_type, frame_id=frame.frame_id, skipped=True)
+                continue
+
+            best = MatchResult(template_type, frame_id=frame.frame_id)
+            for future in futures:
+                result = future.result()
+                if best.name is None or result.confidence > best.confidence:
+                    best = result
+            results[template_type] = best
+            confirmed = stop_on_found and best.found
+        return results
+
+    def first_found(self, frame, types):
+        """Returns the MatchResult of the highest-priority confirmed type, or None"""
+        results = self.evaluate(frame, types)
+        for template_type in types:
+            if results[template_type].found:
+                return results[template_type]
+        return None
+
+    def close(self):
+        """Shuts the thread pool down"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
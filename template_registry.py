@@ -0,0 +1,202 @@
+from collections import Counter
+import numpy as np
+import cv2
+
+# Threshold used when a profile has no value for a template type
+DEFAULT_THRESHOLD = 0.95
+
+# Number of distinct hit positions remembered per template
+MAX_HIT_POSITIONS = 8
+
+# Matching strategies selectable per template type
+STRATEGIES = ('single', 'pyramid')
+DEFAULT_STRATEGY = 'single'
+
+# Pixel layouts selectable per template type: full color, luminance or one BGR channel
+MATCH_MODES = ('bgr', 'gray', 'b', 'g', 'r')
+DEFAULT_MODE = 'bgr'
+
+
+def convert_pixels(bgr, mode, out=None):
+    """Converts a BGR image into the layout of a match mode
+
+    Args:
+        out: Optional 2D array of the image's size converted into (not for 'bgr')
+    """
+    if mode == 'bgr':
+        return bgr
+    if mode == 'gray':
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY, dst=out)
+    if out is not None:
+        np.copyto(out, bgr[:, :, 'bgr'.index(mode)])
+        return out
+    return np.ascontiguousarray(bgr[:, :, 'bgr'.index(mode)])
+
+
+class CompiledTemplate:
+    """A template converted once into the layouts the matcher needs"""
+
+    def __init__(self, template_type, name, image, threshold, strategy=DEFAULT_STRATEGY, mode=DEFAULT_MODE):
+        self.id = f"{template_type}/{name}"  # Stable across rebuilds
+        self.type = template_type
+        self.name = name
+        self.image = image  # Original PIL image
+        self.threshold = threshold
+        self.strategy = strategy  # 'single' or 'pyramid' (see template_matcher)
+        self.mode = mode          # Pixel layout matched, one of MATCH_MODES
+
+        # Contiguous BGR and grayscale copies for cv2.matchTemplate
+        self.bgr = np.ascontiguousarray(cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR))
+        self.gray = np.ascontiguousarray(cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+        self.shape = self.bgr.shape[:2]  # (height, width)
+
+        self._converted = {'bgr': self.bgr, 'gray': self.gray}  # Mode -> pixels
+        self._scaled = {}  # (pyramid level, mode) -> downscaled copy
+
+        # Hit history for known-location verification (frame coordinates)
+        self.last_hit = None
+        self.hit_counts = Counter()
+
+    @property
+    def width(self):
+        return self.shape[1]
+
+    @property
+    def height(self):
+        return self.shape[0]
+
+    def pixels(self, mode=None):
+        """Returns the template in a match mode (the type's own mode by default)"""
+        mode = mode or self.mode
+        converted = self._converted.get(mode)
+        if converted is None:
+            converted = convert_pixels(self.bgr, mode)
+            self._converted[mode] = converted
+        return converted
+
+    def scaled(self, level, mode=None):
+        """Returns the template downscaled by 2**level for coarse matching"""
+        mode = mode or self.mode
+        scaled = self._scaled.get((level, mode))
+        if scaled is None:
+            factor = 1 << level
+            size = (max(1, self.width // factor), max(1, self.height // factor))
+            scaled = cv2.resize(self.pixels(mode), size, interpolation=cv2.INTER_AREA)
+            self._scaled[(level, mode)] = scaled
+        return scaled
+
+    def record_hit(self, location):
+        """Remembers a position where the template was found"""
+        self.last_hit = location
+        if location not in self.hit_counts and len(self.hit_counts) >= MAX_HIT_POSITIONS:
+            # Forget the rarest position so the history stays small
+            del self.hit_counts[min(self.hit_counts, key=self.hit_counts.get)]
+        self.hit_counts[location] += 1
+
+    def known_locations(self):
+        """Returns the positions to verify first: last hit, then the typical one"""
+        locations = []
+        if self.last_hit is not None:
+            locations.append(self.last_hit)
+        if self.hit_counts:
+            typical = self.hit_counts.most_common(1)[0][0]
+            if typical != self.last_hit:
+                locations.append(typical)
+        return locations
+
+    def copy_hits_from(self, other):
+        """Takes over the hit history of an older compilation of the same template"""
+        self.last_hit = other.last_hit
+        self.hit_counts = Counter(other.hit_counts)
+
+    def __repr__(self):
+        return f"CompiledTemplate({self.id}, threshold={self.threshold:.2f})"
+
+
+class TemplateRegistry:
+    """Compiled templates with O(1) lookup by type, id and source image"""
+
+    def __init__(self):
+        self._by_type = {}
+        self._by_id = {}
+        self._by_image = {}  # id() of the PIL image -> entry, for legacy callers
+
+    def build(self, templates, thresholds, strategies=None, modes=None):
+        """Compiles all templates
+
+        Args:
+            templates: Dictionary with template types as keys and lists of
+                       template dicts ('name', 'image') as values
+            thresholds: Dictionary with the threshold per template type
+            strategies: Optional dictionary with the matching strategy per type
+            modes: Optional dictionary with the match mode per type
+        """
+        strategies = strategies or {}
+        modes = modes or {}
+        previous = self._by_id
+        self._by_type = {}
+        self._by_id = {}
+        self._by_image = {}
+        for template_type, template_list in templates.items():
+            entries = []
+            threshold = thresholds.get(template_type, DEFAULT_THRESHOLD)
+            strategy = strategies.get(template_type, DEFAULT_STRATEGY)
+            mode = modes.get(template_type, DEFAULT_MODE)
+            if mode not in MATCH_MODES:
+                mode = DEFAULT_MODE
+            for template in template_list:
+                if template.get('image') is None:
+                    continue
+                entry = CompiledTemplate(template_type, template['name'], template['image'], threshold, strategy, mode)
+                if entry.id in previous:
+                    entry.copy_hits_from(previous[entry.id])
+                entries.append(entry)
+                self._by_id[entry.id] = entry
+                self._by_image[id(template['image'])] = entry
+            self._by_type[template_type] = entries
+
+    def update_thresholds(self, thresholds):
+        """Applies changed thresholds to the compiled entries without recompiling"""
+        for template_type, entries in self._by_type.items():
+            threshold = thresholds.get(template_type, DEFAULT_THRESHOLD)
+            for entry in entries:
+                entry.threshold = threshold
+
+    def update_strategies(self, strategies):
+        """Applies changed matching strategies to the compiled entries"""
+        for template_type, entries in self._by_type.items():
+            strategy = strategies.get(template_type, DEFAULT_STRATEGY)
+            if strategy not in STRATEGIES:
+                strategy = DEFAULT_STRATEGY
+            for entry in entries:
+                entry.strategy = strategy
+
+    def update_modes(self, modes):
+        """Applies changed match modes to the compiled entries"""
+        for template_type, entries in self._by_type.items():
+            mode = modes.get(template_type, DEFAULT_MODE)
+            if mode not in MATCH_MODES:
+                mode = DEFAULT_MODE
+            for entry in entries:
+                entry.mode = mode
+
+    def of_type(self, template_type):
+        """Returns the compiled templates of one type"""
+        return self._by_type.get(template_type, [])
+
+    def get(self, template_id):
+        """Returns a compiled template by its stable id"""
+        return self._by_id.get(template_id)
+
+    def lookup_image(self, image):
+        """Returns the compiled template built from this PIL image, if any"""
+        return self._by_image.get(id(image))
+
+    def types(self):
+        return list(self._by_type.keys())
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __len__(self):
+        return len(self._by_id)
@@ -0,0 +1,363 @@
+import os
+import threading
+from collections import deque
+from bot_logging import WARNING
+from clock import SystemClock
+
+# Windows-only modules - the other backends work without them
+try:
+    import win32gui
+    import win32api
+    HAS_WIN32 = True
+except ImportError:
+    HAS_WIN32 = False
+
+# X11 access for Linux hosts (python-xlib)
+try:
+    from Xlib import X, display as xdisplay
+    HAS_XLIB = True
+except ImportError:
+    HAS_XLIB = False
+
+# Seconds between full geometry queries while the window rect stays the same
+DEFAULT_REFRESH_INTERVAL = 2.0
+
+# Seconds between the cheap window rect checks
+DEFAULT_CHECK_INTERVAL = 0.1
+
+# Calls a FakeWindowBackend keeps, the oldest are dropped
+DEFAULT_MAX_CALLS = 10000
+
+
+class WindowBackend:
+    """Interface to the window system: finding the game window, its geometry
+    and foreground handling (key/mouse events are in input_backend.py)
+
+    Window handles are opaque values of the backend. window_rect() is the
+    cheap check (one call), client_area() the full query returning an MSS
+    style monitor dict of the client area in screen coordinates.
+    """
+
+    def find_window(self, title):
+        """Returns the handle of a visible window with exactly this title, or None"""
+        raise NotImplementedError
+
+    def restore(self, handle):
+        """Restores a minimized window"""
+        raise NotImplementedError
+
+    def window_rect(self, handle):
+        """Returns (left, top, right, bottom) of the window frame, or None"""
+        raise NotImplementedError
+
+    def client_area(self, handle):
+        """Returns {'left', 'top', 'width', 'height'} of the client area, or None"""
+        raise NotImplementedError
+
+    def monitor_number(self, handle):
+        """Returns the 1-based number of the monitor showing the window"""
+        return 1
+
+    def screen_size(self):
+        """Returns (width, height) of the primary screen"""
+        raise NotImplementedError
+
+    def get_foreground(self):
+        """Returns the handle of the window that has the focus"""
+        raise NotImplementedError
+
+    def set_foreground(self, handle):
+        """Gives a window the focus"""
+        raise NotImplementedError
+
+
+class Win32WindowBackend(WindowBackend):
+    """The Windows desktop through pywin32"""
+
+    def find_window(self, title):
+        if not HAS_WIN32:
+            return None
+
+        def window_enum_callback(hwnd, results):
+            if win32gui.IsWindowVisible(hwnd) and win32gui.GetWindowText(hwnd) == title:
+                results.append(hwnd)
+            return True
+
+        results = []
+        win32gui.EnumWindows(window_enum_callback, results)
+        return results[0] if results else None
+
+    def restore(self, handle):
+        win32gui.ShowWindow(handle, 9)  # SW_RESTORE
+
+    def window_rect(self, handle):
+        if not HAS_WIN32:
+            return None
+        return tuple(win32gui.GetWindowRect(handle))
+
+    def client_area(self, handle):
+        if not HAS_WIN32:
+            return None
+        client_rect = win32gui.GetClientRect(handle)
+
+        # Convert client coordinates to screen coordinates
+        left, top = win32gui.ClientToScreen(handle, (0, 0))
+        right, bottom = win32gui.ClientToScreen(handle, (client_rect[2], client_rect[3]))
+        return {"top": top, "left": left, "width": right - left, "height": bottom - top}
+
+    def monitor_number(self, handle):
+        monitor = win32api.MonitorFromWindow(handle)
+        for i, m in enumerate(win32api.EnumDisplayMonitors()):
+            if m[0] == monitor:
+                return i + 1
+        return 1  # Default to 1 if we can't determine
+
+    def screen_size(self):
+        return win32api.GetSystemMetrics(0), win32api.GetSystemMetrics(1)
+
+    def get_foreground(self):
+        return win32gui.GetForegroundWindow()
+
+    def set_foreground(self, handle):
+        win32gui.SetForegroundWindow(handle)
+
+
+class X11WindowBackend(WindowBackend):
+    """An X11 desktop through python-xlib
+
+    Lets the detection and input pipeline run against the Linux client (or
+    any window with the same title) the same way mss captures it there.
+    """
+
+    def __init__(self, display_name=None):
+        self._display = xdisplay.Display(display_name)
+        self._root = self._display.screen().root
+        self._net_active = self._display.intern_atom('_NET_ACTIVE_WINDOW')
+        self._net_name = self._display.intern_atom('_NET_WM_NAME')
+        self._lock = threading.Lock()  # One Xlib connection, used from several threads
+
+    def _window(self, handle):
+        return self._display.create_resource_object('window', handle)
+
+    def _title(self, window):
+        name = window.get_full_property(self._net_name, X.AnyPropertyType)
+        if name is not None:
+            value = name.value
+            return value.decode('utf-8', 'replace') if isinstance(value, bytes) else str(value)
+        return window.get_wm_name()
+
+    def find_window(self, title):
+        with self._lock:
+            pending = [self._root]
+            while pending:
+                window = pending.pop()
+                try:
+                    if (window.get_attributes().map_state == X.IsViewable and
+                            self._title(window) == title):
+                        return window.id
+                    pending.extend(window.query_tree().children)
+                except Exception:
+                    continue  # Window vanished while walking the tree
+            return None
+
+    def restore(self, handle):
+        with self._lock:
+            self._window(handle).map()
+            self._display.sync()
+
+    def window_rect(self, handle):
+        area = self.client_area(handle)
+        if area is None:
+            return None
+        return (area["left"], area["top"], area["left"] + area["width"], area["top"] + area["height"])
+
+    def client_area(self, handle):
+        with self._lock:
+            window = self._window(handle)
+            geometry = window.get_geometry()
+            origin = window.translate_coords(self._root, 0, 0)
+        # translate_coords gives the root origin in window coordinates
+        return {"top": -origin.y, "left": -origin.x, "width": geometry.width, "height": geometry.height}
+
+    def screen_size(self):
+        screen = self._display.screen()
+        return screen.width_in_pixels, screen.height_in_pixels
+
+    def get_foreground(self):
+        with self._lock:
+            active = self._root.get_full_property(self._net_active, X.AnyPropertyType)
+        return active.value[0] if active is not None and len(active.value) else None
+
+    def set_foreground(self, handle):
+        with self._lock:
+            window = self._window(handle)
+            window.raise_window()
+            window.set_input_focus(X.RevertToParent, X.CurrentTime)
+            self._display.sync()
+
+
+class FakeWindowBackend(WindowBackend):
+    """In-memory desktop for tests and benchmarks without a window system
+
+    Every window is a client area with a title and a fixed frame inset (title
+    bar and borders). Every call is recorded in `calls` (the newest max_calls).
+    """
+
+    def __init__(self, windows=None, inset=(8, 31, 8, 8), screen=(1920, 1080), clock=None,
+                 max_calls=DEFAULT_MAX_CALLS):
+        """Creates the backend
+
+        Args:
+            windows: Dictionary handle -> (left, top, width, height) of the client
+                     area, these windows are titled "Temtem"
+            inset: (left, top, right, bottom) border between frame and client area
+            screen: (width, height) of the screen
+            clock: Clock for the timestamps of the recorded calls
+            max_calls: Maximum calls kept in `calls`, the oldest are dropped
+        """
+        self.inset = inset
+        self.screen = screen
+        self.clock = clock or SystemClock()
+        self.windows = {}
+        self.titles = {}
+        self.foreground = None
+        self.calls = deque(maxlen=max_calls)  # (time, method name, arguments)
+        for handle, area in (windows or {}).items():
+            self.place(handle, *area)
+
+    def _record(self, name, *args):
+        self.calls.append((self.clock.time(), name, args))
+
+    def place(self, handle, left, top, width, height, title="Temtem"):
+        """Creates, moves or resizes a window (client area coordinates)"""
+        self.windows[handle] = (left, top, width, height)
+        self.titles.setdefault(handle, title)
+
+    def close(self, handle):
+        self.windows.pop(handle, None)
+        self.titles.pop(handle, None)
+
+    def calls_to(self, name):
+        """Returns the arguments of all recorded calls of one method"""
+        return [args for _, call, args in self.calls if call == name]
+
+    def find_window(self, title):
+        self._record('find_window', title)
+        for handle, window_title in self.titles.items():
+            if window_title == title:
+                return handle
+        return None
+
+    def restore(self, handle):
+        self._record('restore', handle)
+
+    def window_rect(self, handle):
+        self._record('window_rect', handle)
+        if handle not in self.windows:
+            return None
+        left, top, width, height = self.windows[handle]
+        inset_left, inset_top, inset_right, inset_bottom = self.inset
+        return (left - inset_left, top - inset_top, left + width + inset_right, top + height + inset_bottom)
+
+    def client_area(self, handle):
+        self._record('client_area', handle)
+        if handle not in self.windows:
+            return None
+        left, top, width, height = self.windows[handle]
+        return {"top": top, "left": left, "width": width, "height": height}
+
+    def screen_size(self):
+        return self.screen
+
+    def get_foreground(self):
+        self._record('get_foreground')
+        return self.foreground
+
+    def set_foreground(self, handle):
+        self._record('set_foreground', handle)
+        self.foreground = handle
+
+
+def default_window_backend():
+    """Returns the backend of the running desktop
+
+    Win32 on Windows, X11 if a display is available, else an empty fake
+    desktop (attaching then simply finds no game window).
+    """
+    if HAS_WIN32:
+        return Win32WindowBackend()
+    if HAS_XLIB and os.environ.get('DISPLAY'):
+        try:
+            return X11WindowBackend()
+        except Exception as e:
+            print(f"Could not open the X display: {e}")
+    return FakeWindowBackend()
+
+
+class WindowGeometry:
+    """Caches the client area of the game window
+
+    The full client area query costs several window system calls, so it only
+    runs every refresh_interval seconds, or as soon as the cheap window rect
+    check (at most every check_interval seconds) sees the window move or
+    resize. `version` increases whenever the client area changes, so frame
+    buffers and search regions built for the old geometry can be rebuilt.
+    """
+
+    def __init__(self, backend, refresh_interval=DEFAULT_REFRESH_INTERVAL,
+                 check_interval=DEFAULT_CHECK_INTERVAL, clock=None, log=None):
+        self.backend = backend
+        self.log = log or (lambda message, level: print(message))  # log(message, level)
+        self.refresh_interval = refresh_interval
+        self.check_interval = check_interval
+        self.clock = clock or SystemClock()
+        self.version = 0
+        self._handle = None
+        self._area = None
+        self._rect = None
+        self._refreshed_at = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self, handle):
+        """Returns the cached client area of a window as MSS monitor dict, or None"""
+        if not handle:
+            return None
+        with self._lock:
+            now = self.clock.time()
+            if handle != self._handle or self._refreshed_at is None:
+                return self._refresh(handle, now)
+            if now - self._refreshed_at >= self.refresh_interval:
+                return self._refresh(handle, now)
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                try:
+                    rect = self.backend.window_rect(handle)
+                except Exception as e:
+                    # The window may have closed since the last check
+                    self.log(f"Error checking the window position: {e}", WARNING)
+                    return self._refresh(handle, now)
+                if rect != self._rect:
+                    return self._refresh(handle, now)
+            return dict(self._area) if self._area else None
+
+    def _refresh(self, handle, now):
+        try:
+            rect = self.backend.window_rect(handle)
+            area = self.backend.client_area(handle)
+        except Exception as e:
+            self.log(f"Error getting screen coordinates: {e}", WARNING)
+            rect = area = None
+        if area != self._area or handle != self._handle:
+            self.version += 1
+        self._handle = handle
+        self._rect = rect
+        self._area = area
+        self._refreshed_at = now
+        self._checked_at = now
+        return dict(area) if area else None
+
+    def invalidate(self):
+        """Forces a full query on the next get(), e.g. after restoring the window"""
+        with self._lock:
+            self._refreshed_at = None